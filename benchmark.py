@@ -0,0 +1,248 @@
+import sys
+import os
+import json
+import time
+import signal
+import socket
+import asyncio
+import argparse
+import tempfile
+import subprocess
+import timeit
+from typing import Dict, List, Optional, Tuple
+
+import game
+import bitboard
+import protocol
+
+
+SERVER_PATH = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'server.py')
+MOVE_RESULT_PREFIXES = ("MOVE:", "GAMEEND:")
+
+#############################################################
+###################### Microbenchmarks ######################
+#############################################################
+
+def run_microbenchmarks(number: int) -> None:
+    import server
+
+    list_board = game.create_board()
+    for x, y, player in ((0, 0, game.CROSS), (1, 1, game.NOUGHT), (2, 0, game.CROSS)):
+        list_board[y][x] = player
+    board = bitboard.from_board(list_board)
+    gomoku = bitboard.create_board(15, 5)
+    for i in range(20):
+        bitboard.place(game.CROSS if i % 2 == 0 else game.NOUGHT, gomoku, i % 14, (i * 7) % 13)
+
+    def place_classic():
+        bitboard.place(game.CROSS, board[:], 2, 2)
+
+    def place_gomoku():
+        bitboard.place(game.CROSS, gomoku[:], 14, 14)
+
+    cases = [
+        ("game.player_wins", lambda: game.player_wins(game.CROSS, list_board)),
+        ("game.players_draw", lambda: game.players_draw(list_board)),
+        ("bitboard.player_wins", lambda: bitboard.player_wins(game.CROSS, board)),
+        ("bitboard.players_draw", lambda: bitboard.players_draw(board)),
+        ("bitboard.place (3x3)", place_classic),
+        ("bitboard.place (15x15, 5)", place_gomoku),
+        ("server.board_to_string (3x3)", lambda: server.board_to_string(board)),
+        ("server.board_to_string (15x15)", lambda: server.board_to_string(gomoku)),
+        ("protocol.encode_board_status (3x3)", lambda: protocol.encode_board_status(board)),
+        ("protocol.encode_board_status (15x15)", lambda: protocol.encode_board_status(gomoku)),
+    ]
+    print(f"{'benchmark':<40}{'ns/op':>12}")
+    for name, func in cases:
+        seconds = min(timeit.repeat(func, number=number, repeat=5))
+        print(f"{name:<40}{seconds / number * 1e9:>12.0f}")
+
+#############################################################
+##################### Load generation ######################
+#############################################################
+
+class SimulatedClient:
+    """One protocol connection that records the latency of every request it makes"""
+
+    def __init__(self, name: str, latencies: Dict[str, List[float]]) -> None:
+        self.name = name
+        self.latencies = latencies
+        self.messages: asyncio.Queue = asyncio.Queue()
+        self.reader: Optional[asyncio.StreamReader] = None
+        self.writer: Optional[asyncio.StreamWriter] = None
+        self.task: Optional[asyncio.Task] = None
+
+    async def connect(self, port: int) -> None:
+        self.reader, self.writer = await asyncio.open_connection('localhost', port)
+        self.task = asyncio.create_task(self._read())
+
+    async def _read(self) -> None:
+        while line := await self.reader.readline():
+            self.messages.put_nowait(line.decode('ascii').rstrip('\n'))
+
+    async def wait_for(self, prefixes: Tuple[str, ...]) -> str:
+        while True:
+            message = await self.messages.get()
+            if message.startswith(prefixes):
+                return message
+
+    async def request(self, message: str, prefixes: Tuple[str, ...]) -> str:
+        command = message.split(':', 1)[0]
+        start = time.perf_counter()
+        self.writer.write(message.encode('ascii') + b'\n')
+        response = await self.wait_for(prefixes)
+        self.latencies.setdefault(command, []).append(time.perf_counter() - start)
+        return response
+
+    async def close(self) -> None:
+        self.writer.close()
+        self.task.cancel()
+
+
+async def play_game(index: int, creator: SimulatedClient, opponent: SimulatedClient,
+                    viewers: List[SimulatedClient], forfeit: bool) -> int:
+    room_name = f"bench-{index}"
+    # A refused CREATE or JOIN would otherwise leave the game waiting for BEGIN forever
+    expect_ack(await creator.request(f"CREATE:{room_name}", ("CREATE:",)))
+    expect_ack(await opponent.request(f"JOIN:{room_name}:PLAYER", ("JOIN:",)))
+    await creator.wait_for(("BEGIN:",))
+    await opponent.wait_for(("BEGIN:",))
+    for viewer in viewers:
+        expect_ack(await viewer.request(f"JOIN:{room_name}:VIEWER", ("JOIN:",)))
+
+    occupied = set()
+    players = (creator, opponent)
+    moves = 0
+    while True:
+        mover, waiter = players[moves % 2], players[(moves + 1) % 2]
+        if forfeit and moves == 2:
+            await mover.request("FORFEIT", ("GAMEEND:",))
+            await waiter.wait_for(("GAMEEND:",))
+            return moves
+        cell = min(set(range(9)) - occupied)
+        response = await mover.request(f"PLACE:{cell % 3}:{cell // 3}", MOVE_RESULT_PREFIXES)
+        await waiter.wait_for(MOVE_RESULT_PREFIXES)
+        moves += 1
+        if response.startswith("GAMEEND:"):
+            return moves
+        occupied.add(cell)
+
+
+def expect_ack(response: str) -> None:
+    if not response.endswith(":ACKSTATUS:0"):
+        raise RuntimeError(f"server refused the request: {response}")
+
+
+def process_rss(pid: int) -> int:
+    with open(f"/proc/{pid}/status") as f:
+        for line in f:
+            if line.startswith("VmRSS:"):
+                return int(line.split()[1]) * 1024
+    return 0
+
+
+def percentile(samples: List[float], fraction: float) -> float:
+    ordered = sorted(samples)
+    return ordered[min(len(ordered) - 1, int(fraction * len(ordered)))]
+
+
+async def drive_load(port: int, pid: int, n_games: int, n_viewers: int, n_idle: int) -> None:
+    from server import MAX_ROOMS
+
+    latencies: Dict[str, List[float]] = {}
+
+    if n_idle:
+        rss_before = process_rss(pid)
+        idle = [SimulatedClient(f"idle{i}", latencies) for i in range(n_idle)]
+        for client in idle:
+            await client.connect(port)
+        await asyncio.sleep(0.5)
+        per_connection = (process_rss(pid) - rss_before) / n_idle
+        print(f"memory per idle connection: {per_connection:.0f} bytes ({n_idle} connections)")
+        for client in idle:
+            await client.close()
+
+    clients = [SimulatedClient(f"user{i}", latencies) for i in range(n_games * (2 + n_viewers))]
+    await asyncio.gather(*(client.connect(port) for client in clients))
+    await asyncio.gather(*(client.request(f"REGISTER:{client.name}:pw", ("REGISTER:",)) for client in clients))
+    await asyncio.gather(*(client.request(f"LOGIN:{client.name}:pw", ("LOGIN:",)) for client in clients))
+
+    groups = [clients[i:i + 2 + n_viewers] for i in range(0, len(clients), 2 + n_viewers)]
+    # The server refuses rooms beyond MAX_ROOMS, so later games start as earlier ones finish
+    room_slots = asyncio.Semaphore(MAX_ROOMS)
+
+    async def play_when_room(i: int, group: List[SimulatedClient]) -> int:
+        async with room_slots:
+            return await play_game(i, group[0], group[1], group[2:], forfeit=i % 4 == 3)
+
+    start = time.perf_counter()
+    moves = await asyncio.gather(*(play_when_room(i, group) for i, group in enumerate(groups)))
+    elapsed = time.perf_counter() - start
+    for client in clients:
+        await client.close()
+
+    print(f"{'command':<12}{'count':>8}{'p50 ms':>10}{'p99 ms':>10}")
+    for command, samples in sorted(latencies.items()):
+        print(f"{command:<12}{len(samples):>8}{percentile(samples, 0.5) * 1e3:>10.2f}{percentile(samples, 0.99) * 1e3:>10.2f}")
+    print(f"moves/sec: {sum(moves) / elapsed:.0f} ({sum(moves)} moves in {elapsed:.2f}s)")
+
+
+def wait_for_port(port: int, timeout: float = 10.0) -> None:
+    deadline = time.monotonic() + timeout
+    while time.monotonic() < deadline:
+        try:
+            with socket.create_connection(('localhost', port), timeout=0.2):
+                return
+        except OSError:
+            time.sleep(0.05)
+    raise RuntimeError(f"server did not start listening on port {port}")
+
+
+def run_load(args: argparse.Namespace) -> None:
+    with tempfile.TemporaryDirectory() as directory:
+        db_path = os.path.join(directory, 'users.json')
+        config_path = os.path.join(directory, 'config.json')
+        with open(db_path, 'w') as f:
+            json.dump([], f)
+        with open(config_path, 'w') as f:
+            # Every load client connects from localhost, so the per-IP limit would throttle the run
+            json.dump({"port": args.port, "userDatabase": db_path, "bcryptRounds": 4, "ipCommandRate": None}, f)
+
+        command = [sys.executable]
+        if args.profile:
+            command += ['-m', 'cProfile', '-o', args.profile]
+        server = subprocess.Popen(command + [SERVER_PATH, config_path], stdout=subprocess.DEVNULL)
+        try:
+            wait_for_port(args.port)
+            asyncio.run(drive_load(args.port, server.pid, args.games, args.viewers, args.idle))
+        finally:
+            # SIGINT lets the server exit normally so cProfile writes its output
+            server.send_signal(signal.SIGINT)
+            server.wait(timeout=10)
+    if args.profile:
+        print(f"CPU profile written to {args.profile} (view with: python -m pstats {args.profile})")
+
+
+def main(args: List[str]) -> None:
+    parser = argparse.ArgumentParser(description="Benchmarks for the tic-tac-toe engine and server")
+    commands = parser.add_subparsers(dest='command', required=True)
+
+    micro = commands.add_parser('micro', help="time the game engine hot paths")
+    micro.add_argument('--number', type=int, default=100000)
+
+    load = commands.add_parser('load', help="drive a local server through the real protocol")
+    load.add_argument('--port', type=int, default=18888)
+    load.add_argument('--games', type=int, default=500, help="games to play, at most server.MAX_ROOMS at once")
+    load.add_argument('--viewers', type=int, default=2, help="viewers per game")
+    load.add_argument('--idle', type=int, default=1000, help="idle connections for the memory measurement")
+    load.add_argument('--profile', help="write a cProfile of the server to this path")
+
+    parsed = parser.parse_args(args)
+    if parsed.command == 'micro':
+        run_microbenchmarks(parsed.number)
+    else:
+        run_load(parsed)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -0,0 +1,280 @@
+import math
+from typing import Optional
+
+from game import BOARD_SIZE, NOUGHT, CROSS, EMPTY, print_board as _print_list_board
+# The prompt is the same for both representations, so it works on the list form like print_board
+from game import _empty_board_position as _empty_list_board_position
+
+
+__all__ = [
+    "WIN_MASKS",
+    "create_board",
+    "board_size",
+    "win_length",
+    "print_board",
+    "player_turn",
+    "player_wins",
+    "players_draw",
+    "place",
+    "board_to_string",
+    "from_string",
+    "to_packed",
+    "from_packed",
+    "from_board",
+    "to_board"
+]
+
+
+N_CELLS = BOARD_SIZE * BOARD_SIZE
+FULL_MASK = (1 << N_CELLS) - 1
+MAX_BOARD_SIZE = 19
+
+# A bitboard is a mutable [crosses, noughts, moves, size, win_length] list. Bit
+# ``y * size + x`` of a player's mask is set when that player occupies column x, row y.
+Bitboard = list[int]
+
+_CROSSES = 0
+_NOUGHTS = 1
+_MOVES = 2
+_SIZE = 3
+_WIN_LENGTH = 4
+
+# Directions of the four lines through a cell; each is walked both ways
+_DIRECTIONS = ((1, 0), (0, 1), (1, 1), (1, -1))
+
+#############################################################
+############### Private functions—do not use! ###############
+#############################################################
+
+def _cell(x: int, y: int, size: int = BOARD_SIZE) -> int:
+    return y * size + x
+
+
+def _line_mask(cells) -> int:
+    mask = 0
+    for x, y in cells:
+        mask |= 1 << _cell(x, y)
+    return mask
+
+
+def _win_masks() -> tuple[int, ...]:
+    lines = []
+    for i in range(BOARD_SIZE):
+        lines.append(_line_mask((x, i) for x in range(BOARD_SIZE)))
+        lines.append(_line_mask((i, y) for y in range(BOARD_SIZE)))
+    lines.append(_line_mask((i, i) for i in range(BOARD_SIZE)))
+    lines.append(_line_mask((BOARD_SIZE - 1 - i, i) for i in range(BOARD_SIZE)))
+    return tuple(lines)
+
+
+def _player_index(player: str) -> int:
+    return _CROSSES if player == CROSS else _NOUGHTS
+
+
+def _is_classic(board: Bitboard) -> bool:
+    return board[_SIZE] == BOARD_SIZE and board[_WIN_LENGTH] == BOARD_SIZE
+
+
+def _wins_through(mask: int, size: int, win_length: int, x: int, y: int) -> bool:
+    """Whether mask has win_length in a row on one of the four lines through (x, y)"""
+    if win_length == 1:
+        # The cell is a line of its own
+        return bool(mask >> (y * size + x) & 1)
+    for dx, dy in _DIRECTIONS:
+        count = 1
+        for step_x, step_y in ((dx, dy), (-dx, -dy)):
+            cx = x + step_x
+            cy = y + step_y
+            while 0 <= cx < size and 0 <= cy < size and mask >> (cy * size + cx) & 1:
+                count += 1
+                if count >= win_length:
+                    return True
+                cx += step_x
+                cy += step_y
+    return False
+
+
+def _spread(mask: int) -> int:
+    spread = 0
+    shift = 0
+    while mask:
+        spread |= _SPREAD[mask & 0xff] << shift
+        mask >>= 8
+        shift += 16
+    return spread
+
+
+def _compact(spread: int) -> int:
+    """Inverse of _spread: gathers the even bits back together"""
+    mask = 0
+    bit = 0
+    while spread:
+        mask |= (spread & 1) << bit
+        spread >>= 2
+        bit += 1
+    return mask
+
+
+WIN_MASKS = _win_masks()
+# The win lines running through each cell, so a move only needs to test its own lines
+CELL_WIN_MASKS = tuple(
+    tuple(mask for mask in WIN_MASKS if mask >> cell & 1)
+    for cell in range(N_CELLS)
+)
+_CELL_CHARS = ('0', '1', '2')
+# Each byte value with its bits spread to the even positions: bit i moves to bit 2i
+_SPREAD = tuple(sum((byte >> i & 1) << 2 * i for i in range(8)) for byte in range(256))
+
+##########################################################
+############### Public functions—use these ###############
+##########################################################
+
+def create_board(size: int = BOARD_SIZE, win_length: Optional[int] = None) -> Bitboard:
+    """Create a new, empty size x size bitboard won by win_length in a row (default: size)"""
+    if win_length is None:
+        win_length = size
+    if not 1 <= win_length <= size <= MAX_BOARD_SIZE:
+        raise ValueError(f"invalid {size}x{size} board with {win_length} in a row")
+    return [0, 0, 0, size, win_length]
+
+
+def board_size(board: Bitboard) -> int:
+    """The number of rows (and columns) of the bitboard"""
+    return board[_SIZE]
+
+
+def win_length(board: Bitboard) -> int:
+    """How many in a row win on the bitboard"""
+    return board[_WIN_LENGTH]
+
+
+def print_board(board: Bitboard):
+    """Print the bitboard"""
+    _print_list_board(to_board(board))
+
+
+def player_turn(player: str, board: Bitboard) -> tuple[int, int]:
+    """Does a player's turn and returns the position of the turn"""
+    y, x = _empty_list_board_position(to_board(board))
+    place(player, board, x, y)
+    return (x + 1, y + 1)
+
+
+def place(player: str, board: Bitboard, x: int, y: int) -> bool:
+    """Places the player's marker at (x, y) and returns whether that move wins.
+
+    Only the lines through (x, y) are tested: the precomputed win masks on
+    the classic board, otherwise at most win_length cells in each of four
+    directions, so the cost does not grow with the board area. Raises
+    ValueError if the position is off the board or already occupied.
+    """
+    size = board[_SIZE]
+    if not (0 <= x < size and 0 <= y < size):
+        raise ValueError(f"({x}, {y}) is off the board")
+    cell = _cell(x, y, size)
+    bit = 1 << cell
+    if (board[_CROSSES] | board[_NOUGHTS]) & bit:
+        raise ValueError(f"({x}, {y}) is already occupied")
+
+    index = _player_index(player)
+    mask = board[index] | bit
+    board[index] = mask
+    board[_MOVES] += 1
+    if not _is_classic(board):
+        return _wins_through(mask, size, board[_WIN_LENGTH], x, y)
+    for line in CELL_WIN_MASKS[cell]:
+        if mask & line == line:
+            return True
+    return False
+
+
+def player_wins(player: str, board: Bitboard) -> bool:
+    """Determines whether the specified player wins given the bitboard"""
+    mask = board[_player_index(player)]
+    if not _is_classic(board):
+        size = board[_SIZE]
+        remaining = mask
+        while remaining:
+            cell = (remaining & -remaining).bit_length() - 1
+            if _wins_through(mask, size, board[_WIN_LENGTH], cell % size, cell // size):
+                return True
+            remaining &= remaining - 1
+        return False
+    for line in WIN_MASKS:
+        if mask & line == line:
+            return True
+    return False
+
+
+def players_draw(board: Bitboard) -> bool:
+    """Determines whether the bitboard is full"""
+    return board[_MOVES] == board[_SIZE] * board[_SIZE]
+
+
+def board_to_string(board: Bitboard) -> str:
+    """Encodes the bitboard as one '0' (empty), '1' (cross) or '2' (nought) per cell"""
+    crosses, noughts, _, size, _ = board
+    return ''.join(
+        _CELL_CHARS[(crosses >> cell & 1) | (noughts >> cell & 1) << 1]
+        for cell in range(size * size)
+    )
+
+
+def from_string(board_status: str, win_length: Optional[int] = None) -> Bitboard:
+    """Inverse of board_to_string; the string's length gives the board size"""
+    size = math.isqrt(len(board_status))
+    board = create_board(size, win_length)
+    for cell, char in enumerate(board_status):
+        if char != '0':
+            board[_CROSSES if char == '1' else _NOUGHTS] |= 1 << cell
+            board[_MOVES] += 1
+    return board
+
+
+def to_packed(board: Bitboard) -> bytes:
+    """Packs the cells into 2 bits each, cell 0 in the low bits of the first byte.
+
+    Cell codes match board_to_string (0 empty, 1 cross, 2 nought); a 3x3
+    board takes 3 bytes.
+    """
+    crosses, noughts, _, size, _ = board
+    return (_spread(crosses) | _spread(noughts) << 1).to_bytes((size * size + 3) // 4, 'little')
+
+
+def from_packed(data: bytes, size: int, win_length: Optional[int] = None) -> Bitboard:
+    """Rebuilds a bitboard from to_packed output"""
+    packed = int.from_bytes(data, 'little')
+    bitboard = create_board(size, win_length)
+    even_bits = _spread((1 << size * size) - 1)
+    crosses = _compact(packed & even_bits)
+    noughts = _compact(packed >> 1 & even_bits)
+    bitboard[_CROSSES] = crosses
+    bitboard[_NOUGHTS] = noughts
+    bitboard[_MOVES] = crosses.bit_count() + noughts.bit_count()
+    return bitboard
+
+
+def from_board(board: list[list[str]], win_length: Optional[int] = None) -> Bitboard:
+    """Converts a list-of-lists board from :mod:`game` into a bitboard"""
+    size = len(board)
+    bitboard = create_board(size, win_length)
+    for y, row in enumerate(board):
+        for x, value in enumerate(row):
+            if value != EMPTY:
+                bitboard[_player_index(value)] |= 1 << _cell(x, y, size)
+                bitboard[_MOVES] += 1
+    return bitboard
+
+
+def to_board(board: Bitboard) -> list[list[str]]:
+    """Converts a bitboard into a list-of-lists board from :mod:`game`"""
+    crosses, noughts, _, size, _ = board
+    return [
+        [
+            CROSS if crosses >> _cell(x, y, size) & 1 else
+            NOUGHT if noughts >> _cell(x, y, size) & 1 else
+            EMPTY
+            for x in range(size)
+        ]
+        for y in range(size)
+    ]
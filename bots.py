@@ -0,0 +1,111 @@
+import sys
+import time
+import random
+import asyncio
+import argparse
+from typing import List, NamedTuple, Optional
+
+from client import GameClient, RequestError
+from simulate import STRATEGIES, Strategy
+
+
+__all__ = [
+    "BotStats",
+    "run_bot",
+    "run_bots"
+]
+
+
+class BotStats(NamedTuple):
+    games: int = 0
+    wins: int = 0
+    moves: int = 0
+
+    def __add__(self, other: 'BotStats') -> 'BotStats':
+        return BotStats(*(mine + theirs for mine, theirs in zip(self, other)))
+
+##########################################################
+############### Public functions—use these ###############
+##########################################################
+
+async def run_bot(host: str, port: int, username: str, password: str, n_games: int,
+                  strategy: Strategy, rng: Optional[random.Random] = None) -> BotStats:
+    """Logs in as username (registering it first if needed) and plays n_games through QUICKPLAY"""
+    if rng is None:
+        rng = random.Random()
+    client = await GameClient.open(host, port)
+    games_over: asyncio.Queue = asyncio.Queue()
+    stats = {"wins": 0, "moves": 0}
+
+    async def play(client: GameClient) -> None:
+        x, y = strategy(client.turn_symbol, client.board, rng)
+        try:
+            await client.place(x, y)
+            stats["moves"] += 1
+        except RequestError:
+            # The game ended under us, e.g. the opponent forfeited
+            pass
+
+    def game_over(client: GameClient, result: int, winner: Optional[str]) -> None:
+        if winner == client.username:
+            stats["wins"] += 1
+        games_over.put_nowait(result)
+
+    client.on_turn = play
+    client.on_game_end = game_over
+    client.on_close = lambda client: games_over.put_nowait(None)
+    try:
+        await client.register(username, password)
+        if await client.login(username, password) != 0:
+            raise RequestError(f"LOGIN failed for {username}")
+        for played in range(n_games):
+            if await client.quickplay() != 0:
+                raise RequestError(f"QUICKPLAY refused for {username}")
+            if await games_over.get() is None:
+                return BotStats(played, stats["wins"], stats["moves"])
+        return BotStats(n_games, stats["wins"], stats["moves"])
+    finally:
+        await client.close()
+
+
+async def run_bots(host: str, port: int, n_bots: int, n_games: int, strategy: Strategy,
+                   prefix: str = "bot", password: str = "bot", seed: Optional[int] = None) -> BotStats:
+    """Runs n_bots concurrent sessions on one event loop; they are matched against each other"""
+    rng = random.Random(seed)
+    results = await asyncio.gather(*(
+        run_bot(host, port, f"{prefix}{i}", password, n_games, strategy, random.Random(rng.random()))
+        for i in range(n_bots)
+    ))
+    total = BotStats()
+    for result in results:
+        total += result
+    return total
+
+
+def main(args: List[str]) -> None:
+    parser = argparse.ArgumentParser(description="Play many headless bot sessions against a server from one process")
+    parser.add_argument('host')
+    parser.add_argument('port', type=int)
+    parser.add_argument('--bots', type=int, default=100)
+    parser.add_argument('--games', type=int, default=10, help="games per bot")
+    parser.add_argument('--strategy', choices=sorted(STRATEGIES), default='random')
+    parser.add_argument('--prefix', default='bot', help="usernames are this prefix plus a number")
+    parser.add_argument('--password', default='bot')
+    parser.add_argument('--seed', type=int)
+    parsed = parser.parse_args(args)
+
+    start = time.perf_counter()
+    try:
+        stats = asyncio.run(run_bots(parsed.host, parsed.port, parsed.bots, parsed.games,
+                                     STRATEGIES[parsed.strategy], parsed.prefix, parsed.password, parsed.seed))
+    except ConnectionRefusedError:
+        print(f"Error: cannot connect to server at {parsed.host} and {parsed.port}.")
+        sys.exit(1)
+    elapsed = time.perf_counter() - start
+    print(f"games:   {stats.games} ({stats.games / elapsed:.0f}/s, counted once per bot seat)")
+    print(f"wins:    {stats.wins}")
+    print(f"moves:   {stats.moves} ({stats.moves / elapsed:.0f}/s)")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
@@ -1,305 +1,690 @@
 import sys
-import socket
-import select
-from typing import List, Optional
-from game import create_board, print_board, CROSS, NOUGHT, EMPTY
-
-
-current_board = create_board()
-is_player = False
-username = ""
-current_room = ""
-need_wait = False
-player1 = ""
-player2 = ""
-
-def handle_login(sock: socket.socket) -> bool:
-
-    global username
-
-    username = input("Enter username: ")
-    password = input("Enter password: ")
-    message = f"LOGIN:{username}:{password}"
-    response = send_message(sock, message)
+import math
+import asyncio
+import threading
+from collections import deque
+from typing import Callable, Deque, List, Optional, Tuple
+from game import BOARD_SIZE, CROSS, NOUGHT
+import bitboard
+from bitboard import Bitboard
+from protocol import DELIMITER, MessageBuffer, BinaryMessageBuffer, frame
+
+
+#replies that answer the oldest outstanding request, whatever its command
+GENERIC_REPLIES = ("BADAUTH", "NOROOM", "INVALID COMMAND INPUT")
+#commands answered by something other than "<COMMAND>:..."
+REPLY_PREFIXES = {
+    "PLACE": ("MOVE:", "GAMEEND:", "PLACE:"),
+    "FORFEIT": ("GAMEEND:", "FORFEIT:"),
+    "RESYNC": ("INPROGRESS:", "RESYNC:"),
+}
+#replies that also change what everyone in the room sees, so they are pushed too
+PUSHED_REPLIES = ("MOVE:", "GAMEEND:", "INPROGRESS:")
+
+
+class ClientConnection:
+    """A connection to the server driven by asyncio, for the CLI, bots and load tools.
+
+    The server answers each connection's commands in the order they were
+    sent, so an incoming message answers the oldest outstanding request it
+    can; a reply that overtakes older requests means those got no reply.
+    Anything else is a push and goes to ``on_push`` as soon as it arrives.
+    """
+
+    __slots__ = ('on_push', 'on_close', '_reader', '_writer', '_inbox', '_pending', '_switching', '_read_task')
+
+    def __init__(self, reader: asyncio.StreamReader, writer: asyncio.StreamWriter,
+                 on_push: Optional[Callable[[str], None]] = None,
+                 on_close: Optional[Callable[[], None]] = None) -> None:
+        self.on_push = on_push
+        self.on_close = on_close
+        self._reader = reader
+        self._writer = writer
+        self._inbox = MessageBuffer()
+        #(reply prefixes, future or None for send()) per outstanding command, oldest first
+        self._pending: Deque[Tuple[Tuple[str, ...], Optional[asyncio.Future]]] = deque()
+        #set while PROTO:BINARY is outstanding, when the bytes after its ack are already binary
+        self._switching = False
+        self._read_task = asyncio.ensure_future(self._read_loop())
+
+    @classmethod
+    async def open(cls, host: str, port: int, on_push: Optional[Callable[[str], None]] = None,
+                   on_close: Optional[Callable[[], None]] = None) -> 'ClientConnection':
+        reader, writer = await asyncio.open_connection(host, port)
+        return cls(reader, writer, on_push, on_close)
+
+    @property
+    def closed(self) -> bool:
+        return self._read_task.done()
+
+    def send(self, message: str) -> None:
+        """Sends a command without waiting; its reply, if any, goes to on_push"""
+        self._write(message, None)
+
+    async def request(self, message: str, replies: Optional[Tuple[str, ...]] = None) -> Optional[str]:
+        """Sends a command and returns its reply, or None if the server did not answer it.
+
+        replies overrides the prefixes that count as its reply, for a caller
+        that can tell its own reply from a push that looks the same.
+        """
+        future = asyncio.get_running_loop().create_future()
+        self._write(message, future, replies)
+        await self._writer.drain()
+        return await future
+
+    async def negotiate_binary(self) -> bool:
+        """Switches the server to binary encoding; call it before anything else is outstanding"""
+        self._switching = True
+        try:
+            return await self.request("PROTO:BINARY") == "PROTO:ACKSTATUS:0"
+        finally:
+            self._switching = False
+
+    async def close(self) -> None:
+        self._writer.close()
+        try:
+            await self._writer.wait_closed()
+        except ConnectionError:
+            pass
+        await asyncio.gather(self._read_task, return_exceptions=True)
+
+    def _write(self, message: str, future: Optional[asyncio.Future],
+               replies: Optional[Tuple[str, ...]] = None) -> None:
+        if self.closed:
+            raise ConnectionError("connection closed")
+        if replies is None:
+            command = message.split(":", 1)[0].strip()
+            replies = REPLY_PREFIXES.get(command, (command + ":",))
+        self._pending.append((replies, future))
+        self._writer.write(frame(message))
+
+    async def _read_loop(self) -> None:
+        try:
+            while data := await self._reader.read(8192):
+                if self._switching:
+                    data = self._receive_lines(data)
+                self._inbox.feed(data)
+                while (message := self._inbox.pop()) is not None:
+                    self._receive(message)
+        except ConnectionError:
+            pass
+        finally:
+            while self._pending:
+                _, future = self._pending.popleft()
+                if future is not None and not future.done():
+                    future.set_exception(ConnectionError("connection closed"))
+            if self.on_close is not None:
+                self.on_close()
+
+    def _receive_lines(self, data: bytes) -> bytes:
+        #the text buffer only gets whole lines up to the ack; the rest is left for the binary one
+        while self._switching and (end := data.find(DELIMITER) + 1):
+            self._inbox.feed(data[:end])
+            data = data[end:]
+            while (message := self._inbox.pop()) is not None:
+                self._receive(message)
+        return data
+
+    def _receive(self, message: str) -> None:
+        if message == "PING":
+            #the server's heartbeat; answered here so an idle session isn't reaped
+            if not self.closed:
+                self._writer.write(frame("PONG"))
+            return
+        answered = None
+        for index, (prefixes, _) in enumerate(self._pending):
+            if message.startswith(prefixes) or (index == 0 and message in GENERIC_REPLIES):
+                answered = index
+                break
 
-    if response == "LOGIN:ACKSTATUS:0":
+        if answered is None:
+            self._push(message)
+            return
+        for _ in range(answered):
+            _, future = self._pending.popleft()
+            if future is not None and not future.done():
+                future.set_result(None)
+        _, future = self._pending.popleft()
+
+        if message == "PROTO:ACKSTATUS:0":
+            #everything after the ack is binary, and _receive_lines has kept it out of the text buffer
+            self._inbox = BinaryMessageBuffer()
+            self._switching = False
+        if future is None or message.startswith(PUSHED_REPLIES):
+            self._push(message)
+        if future is not None and not future.done():
+            future.set_result(message)
+
+    def _push(self, message: str) -> None:
+        if self.on_push is not None:
+            self.on_push(message)
+
+
+class RequestError(Exception):
+    """Raised when the server rejects a request outright (BADAUTH, NOROOM, ...) or leaves it unanswered"""
+
+    def __init__(self, reply: Optional[str]) -> None:
+        super().__init__(reply or "no reply")
+        self.reply = reply
+
+
+def _ack_status(reply: Optional[str]) -> int:
+    #"<COMMAND>:ACKSTATUS:<n>[:...]" -> n
+    parts = reply.split(":") if reply else []
+    if len(parts) < 3 or parts[1] != "ACKSTATUS":
+        raise RequestError(reply)
+    return int(parts[2])
+
+
+class GameClient:
+    """One player's session: a ClientConnection plus the room, board and turn it is following.
+
+    Pushes keep the state current and are reported through optional
+    callbacks, each called with the client first: ``on_begin(client)``,
+    ``on_move(client, x, y, symbol)``, ``on_board(client)`` (the whole board
+    was replaced), ``on_turn(client)`` (this player must move),
+    ``on_game_end(client, result, winner)`` and ``on_close(client)``.
+    ``current_turn`` is already updated when they run. A callback may be a
+    coroutine function, which runs as a task, so a bot can await ``place``
+    from ``on_turn``. Nothing here prints or blocks, so one event loop can
+    drive thousands of clients.
+    """
+
+    __slots__ = ('connection', 'username', 'room', 'is_player', 'board', 'win_length', 'player1', 'player2',
+                 'current_turn', 'move_seq', 'token', 'on_begin', 'on_move', 'on_board', 'on_turn', 'on_game_end',
+                 'on_close', '_tasks')
+
+    def __init__(self) -> None:
+        self.connection: Optional[ClientConnection] = None
+        self.username = ""
+        self.room = ""
+        self.is_player = False
+        self.board: Bitboard = bitboard.create_board()
+        #set from CREATE, then from the BEGIN or INPROGRESS that starts or catches up on a game
+        self.win_length: Optional[int] = None
+        self.player1 = ""
+        self.player2 = ""
+        self.current_turn = ""
+        #sequence number of the last MOVE applied to board
+        self.move_seq = 0
+        #presented with RESUME to pick up this session after a dropped connection
+        self.token = ""
+        self.on_begin: Optional[Callable] = None
+        self.on_move: Optional[Callable] = None
+        self.on_board: Optional[Callable] = None
+        self.on_turn: Optional[Callable] = None
+        self.on_game_end: Optional[Callable] = None
+        self.on_close: Optional[Callable] = None
+        self._tasks: set = set()
+
+    @classmethod
+    async def open(cls, host: str, port: int, binary: bool = False) -> 'GameClient':
+        """Connects; with binary, also switches to the binary encoding if the server supports it"""
+        client = cls()
+        await client._connect(host, port)
+        if binary:
+            await client.connection.negotiate_binary()
+        return client
+
+    @property
+    def my_turn(self) -> bool:
+        return self.is_player and self.current_turn == self.username
+
+    @property
+    def turn_symbol(self) -> str:
+        """The marker the player whose turn it is places; crosses move first"""
+        return CROSS if bin(self.board[0]).count('1') == bin(self.board[1]).count('1') else NOUGHT
+
+    def cell_empty(self, x: int, y: int) -> bool:
+        size = bitboard.board_size(self.board)
+        return 0 <= x < size and 0 <= y < size and not (self.board[0] | self.board[1]) >> (y * size + x) & 1
+
+    async def register(self, username: str, password: str) -> int:
+        return _ack_status(await self.connection.request(f"REGISTER:{username}:{password}"))
+
+    async def login(self, username: str, password: str) -> int:
+        status = _ack_status(await self.connection.request(f"LOGIN:{username}:{password}"))
+        if status == 0:
+            self.username = username
+        return status
+
+    async def resume(self, host: str, port: int) -> int:
+        """Reconnects after a dropped connection and takes the session back with its token"""
+        await self._connect(host, port)
+        return _ack_status(await self.connection.request(f"RESUME:{self.token}"))
+
+    async def roomlist(self, mode: str = "PLAYER") -> List[str]:
+        reply = await self.connection.request(f"ROOMLIST:{mode}")
+        if _ack_status(reply) != 0:
+            raise RequestError(reply)
+        rooms = reply.split(":", 3)[3] if reply.count(":") >= 3 else ""
+        return [room for room in rooms.split(",") if room]
+
+    async def create(self, room: str, size: Optional[int] = None, win_length: Optional[int] = None) -> int:
+        message = f"CREATE:{room}" if size is None else f"CREATE:{room}:{size}:{win_length or size}"
+        return await self._enter(room, True, message, win_length)
+
+    async def join(self, room: str, mode: str = "PLAYER") -> int:
+        return await self._enter(room, mode.upper() == "PLAYER", f"JOIN:{room}:{mode.upper()}")
+
+    async def quickplay(self) -> int:
+        return await self._enter("", True, "QUICKPLAY")
+
+    async def add_bot(self) -> int:
+        return _ack_status(await self.connection.request("ADDBOT"))
+
+    async def place(self, x: int, y: int) -> str:
+        """Places a marker; returns the MOVE or GAMEEND it caused, which has already been applied.
+
+        A refused move raises RequestError with its PLACE:ACKSTATUS reply:
+        1 no game in progress, 2 not our turn, 3 off the board or occupied.
+        """
+        #only our own move answers it; the opponent's MOVE may arrive while it is in flight.
+        #player1 is whoever's turn it was after an INPROGRESS, so the symbol comes from the board
+        move = f"MOVE:{self.move_seq + 1}:{x}:{y}:{self.turn_symbol}"
+        reply = await self.connection.request(f"PLACE:{x}:{y}", (move, "GAMEEND:", "PLACE:"))
+        if reply is None or not reply.startswith(("MOVE:", "GAMEEND:")):
+            raise RequestError(reply)
+        return reply
+
+    async def forfeit(self) -> None:
+        """Gives up the game; a refusal raises RequestError with FORFEIT:ACKSTATUS:1 (no game) or 2 (not a player)"""
+        reply = await self.connection.request("FORFEIT")
+        if reply is None or not reply.startswith("GAMEEND:"):
+            raise RequestError(reply)
+
+    async def close(self) -> None:
+        await self.connection.close()
+
+    async def _connect(self, host: str, port: int) -> None:
+        self.connection = await ClientConnection.open(host, port, self._handle_push,
+                                                      lambda: self._fire(self.on_close))
+
+    async def _enter(self, room: str, is_player: bool, message: str, win_length: Optional[int] = None) -> int:
+        #BEGIN or INPROGRESS can arrive right behind the ack, so the seat is set before sending
+        self.is_player = is_player
+        self.win_length = win_length
+        try:
+            status = _ack_status(await self.connection.request(message))
+        except RequestError:
+            self.is_player = False
+            raise
+        if status != 0:
+            self.is_player = False
+        else:
+            self.room = room
+        return status
+
+    def _fire(self, callback: Optional[Callable], *args) -> None:
+        if callback is None:
+            return
+        result = callback(self, *args)
+        if asyncio.iscoroutine(result):
+            task = asyncio.ensure_future(result)
+            self._tasks.add(task)
+            task.add_done_callback(self._tasks.discard)
+
+    def _advance(self, player: str, callback: Optional[Callable], *args) -> None:
+        self.current_turn = player
+        self._fire(callback, *args)
+        if self.my_turn:
+            self._fire(self.on_turn)
+
+    def _new_board(self, size: int = BOARD_SIZE, board_status: str = "") -> Bitboard:
+        #a board string is sent row by row, so its length gives the size
+        if board_status:
+            size = math.isqrt(len(board_status))
+        win_length = self.win_length if self.win_length is not None and self.win_length <= size else None
+        if board_status:
+            return bitboard.from_string(board_status, win_length)
+        return bitboard.create_board(size, win_length)
+
+    def _handle_push(self, message: str) -> None:
+        kind, _, body = message.partition(":")
+        if kind == "MOVE":
+            seq, x, y, symbol = body.split(":")
+            if int(seq) != self.move_seq + 1:
+                #a move was missed, so ask for the whole board; it arrives as INPROGRESS
+                self.connection.send("RESYNC")
+                return
+            self.move_seq = int(seq)
+            bitboard.place(symbol, self.board, int(x), int(y))
+            self._advance(self.player2 if self.current_turn == self.player1 else self.player1,
+                          self.on_move, int(x), int(y), symbol)
+        elif kind == "BOARDSTATUS":
+            self.board = self._new_board(board_status=body)
+            self._advance(self.player2 if self.current_turn == self.player1 else self.player1, self.on_board)
+        elif kind == "BEGIN":
+            self.player1, self.player2, *size = body.split(":")
+            if len(size) > 1:
+                self.win_length = int(size[1])
+            self.board = self._new_board(int(size[0]) if size else BOARD_SIZE)
+            self.move_seq = 0
+            self._advance(self.player1, self.on_begin)
+        elif kind == "INPROGRESS":
+            #sent to a viewer joining mid-game, or after RESYNC or RESUME: whose turn it is, and the board so far
+            current_turn, opposing, *snapshot = body.split(":")
+            self.player1, self.player2 = current_turn, opposing
+            if len(snapshot) > 2:
+                self.win_length = int(snapshot[2])
+            if snapshot:
+                self.board = self._new_board(board_status=snapshot[0])
+            if len(snapshot) > 1:
+                self.move_seq = int(snapshot[1])
+            self._advance(current_turn, self.on_board)
+        elif kind == "GAMEEND":
+            #is_player is left as it was, so on_game_end can tell a player from a viewer
+            board_status, result, *winner = body.split(":")
+            self.board = self._new_board(board_status=board_status)
+            self.room = ""
+            self._advance("", self.on_game_end, int(result), winner[0] if winner else None)
+        elif kind == "TOKEN":
+            self.token = body
+
+
+#the session the interactive CLI drives
+client: Optional[GameClient] = None
+#lines typed on stdin, None at end of input
+input_lines: Optional[asyncio.Queue] = None
+#set while this player has to place a marker
+your_turn: Optional[asyncio.Event] = None
+#set when the connection drops, which cuts any prompt short
+connection_lost: Optional[asyncio.Event] = None
+#after a drop, RESUME is retried this many times this far apart, long enough to ride out a server restart
+RECONNECT_ATTEMPTS = 30
+RECONNECT_DELAY = 1.0
+
+def start_input_reader(loop: asyncio.AbstractEventLoop) -> None:
+    #input() blocks, so a thread reads stdin and hands each line to the event loop
+    def read_lines() -> None:
+        try:
+            for line in sys.stdin:
+                loop.call_soon_threadsafe(input_lines.put_nowait, line.rstrip('\n'))
+            loop.call_soon_threadsafe(input_lines.put_nowait, None)
+        except RuntimeError:
+            #the loop has already shut down
+            pass
+
+    threading.Thread(target=read_lines, daemon=True).start()
+
+async def prompt(text: str, interrupt: Optional[asyncio.Event] = None) -> Optional[str]:
+    #returns None if interrupt is set before a line is typed; the line then goes to the next prompt
+    print(text, end="", flush=True)
+    line = asyncio.ensure_future(input_lines.get())
+    lost = asyncio.ensure_future(connection_lost.wait())
+    waits = {line, lost}
+    if interrupt is not None:
+        waits.add(asyncio.ensure_future(interrupt.wait()))
+    done, others = await asyncio.wait(waits, return_when=asyncio.FIRST_COMPLETED)
+    for other in others:
+        other.cancel()
+    if line not in done:
+        print()
+        if lost in done:
+            raise ConnectionError("connection closed")
+        return None
+    if line.result() is None:
+        raise EOFError
+    return line.result()
+
+async def handle_login() -> None:
+    username = await prompt("Enter username: ")
+    password = await prompt("Enter password: ")
+    status = await client.login(username, password)
+
+    if status == 0:
         print(f"Welcome {username}")
-        return True
-    elif response == "LOGIN:ACKSTATUS:1":
+    elif status == 1:
         print(f"Error: User {username} not found", file=sys.stderr)
-    elif response == "LOGIN:ACKSTATUS:2":
+    elif status == 2:
         print(f"Error: Wrong password for user {username}", file=sys.stderr)
-    return False
-
-def handle_register(sock: socket.socket) -> None:
 
-    username = input("Enter username: ")
-    password = input("Enter password: ")
+async def handle_register() -> None:
+    username = await prompt("Enter username: ")
+    password = await prompt("Enter password: ")
+    status = await client.register(username, password)
 
-    message = f"REGISTER:{username}:{password}"
-    response = send_message(sock, message)
-    
     #process registration response
-    if response == "REGISTER:ACKSTATUS:0":
+    if status == 0:
         print(f"Successfully created user account {username}")
-    elif response == "REGISTER:ACKSTATUS:1":
+    elif status == 1:
         print(f"Error: User {username} already exists",file=sys.stderr)
 
-def handle_roomlist(sock: socket.socket) -> Optional[str]:
-    mode = input("Do you want to have a room list as player or viewer? (Player/Viewer): ").upper()
-    is_player = (mode == "PLAYER")
-
-    message = f"ROOMLIST:{mode}"
-    response = send_message(sock, message)
-
-    
-    if response == "BADAUTH":
-        return "BADAUTH"
-    args_response = response.split(':')
-    if len(args_response) >= 3 and args_response[2] == '0':
-        print(f"Room available to join as {mode}: {args_response[3] if len(args_response) > 3 else 'No rooms available'}")
-    elif len(args_response) >= 3 and args_response[2] == '1':
+async def handle_roomlist() -> None:
+    mode = (await prompt("Do you want to have a room list as player or viewer? (Player/Viewer): ")).upper()
+    try:
+        rooms = await client.roomlist(mode)
+    except RequestError as e:
+        if e.reply == "BADAUTH":
+            raise
         print("Error: Please input a valid mode.")
+        return
+    print(f"Room available to join as {mode}: {','.join(rooms) if rooms else 'No rooms available'}")
+
+async def handle_create() -> None:
+    room_name = await prompt("Enter room name you want to create: ")
+    size = (await prompt("Enter board size (leave blank for 3x3): ")).strip()
+    if size:
+        win_length = (await prompt(f"Enter how many in a row win (leave blank for {size}): ")).strip() or size
+        if not (size.isdigit() and win_length.isdigit()):
+            print("Error: Invalid room name or board size", file=sys.stderr)
+            return
+        status = await client.create(room_name, int(size), int(win_length))
     else:
-        print("Unexpected response from server.")
-    return None
-    
-
-def handle_create(sock: socket.socket) -> None:
-    global current_room, need_wait
-
-    room_name = input("Enter room name you want to create: ")
+        status = await client.create(room_name)
 
-    message = f"CREATE:{room_name}"
-
-    response = send_message(sock, message)
-    if response == "BADAUTH":
-        return response
-
-    if response == "CREATE:ACKSTATUS:0":
+    if status == 0:
         print(f"Successfully created room {room_name}")
-        current_room = room_name
         print("Waiting for other player...")
-        need_wait = True
-    elif response == "CREATE:ACKSTATUS:1":
+    elif status == 1:
         print(f"Error: Room {room_name} is invalid", file=sys.stderr)
-    elif response == "CREATE:ACKSTATUS:2":
+    elif status == 2:
         print(f"Error: Room {room_name} already exists", file=sys.stderr)
-    elif response == "CREATE:ACKSTATUS:3":
+    elif status == 3:
         print("Error: Server already contains a maximum of 256 rooms", file=sys.stderr)
+    elif status == 4:
+        print("Error: Invalid room name or board size", file=sys.stderr)
 
-def handle_join(sock: socket.socket, room_name: Optional[str] = None, mode: Optional[str] = None) -> None:
-    global current_room, username, is_player, opposing_player, current_turn
-    room_name = input("Enter room name you want to join: ")
-    mode = input("You wish to join the room as: (Player/Viewer): ").upper()
-
-    is_player = (mode == "PLAYER")
+async def handle_join() -> None:
+    room_name = await prompt("Enter room name you want to join: ")
+    mode = (await prompt("You wish to join the room as: (Player/Viewer): ")).upper()
+    status = await client.join(room_name, mode)
 
-    if room_name == None or mode == None:
-        return "JOIN:ACKSTATUS:3"
-    message = f"JOIN:{room_name}:{mode}"
-    #send join room request and get response
-    response = send_message(sock, message)
-    if response == "BADAUTH":
-        return response
-
-    #process join room response
-    if response == "JOIN:ACKSTATUS:0":
+    #the game itself starts with a BEGIN push
+    if status == 0:
         print(f"Successfully joined room {room_name} as a {mode}")
-        current_room = room_name
-        is_player = (mode == "PLAYER")
-        if is_player:
-            #wait for BEGIN message to set opposing_player and current_turn
-            begin_message = sock.recv(8192).decode('ascii')
-            if begin_message.startswith("BEGIN:"):
-                _, player1, player2 = begin_message.split(":")
-                opposing_player = player2 if username == player1 else player1
-                current_turn = player1
-    elif response == "JOIN:ACKSTATUS:1":
+    elif status == 1:
         print(f"Error: No room named {room_name}", file=sys.stderr)
-    elif response == "JOIN:ACKSTATUS:2":
+    elif status == 2:
         print(f"Error: The room {room_name} already has 2 players", file=sys.stderr)
 
-def handle_place(sock: socket.socket) -> None:
+async def handle_quickplay() -> None:
+    status = await client.quickplay()
 
-    global current_turn, opposing_player
+    if status == 0:
+        #the game starts with a BEGIN message once an opponent (or a bot) is found
+        print("Waiting for an opponent...")
+    elif status == 1:
+        print("Error: You are already in a room or waiting for a game", file=sys.stderr)
+    elif status == 2:
+        print("Error: Server already contains a maximum of 256 rooms", file=sys.stderr)
+
+async def handle_place() -> None:
+    last = bitboard.board_size(client.board) - 1
     while True:
-        x = int(input("Enter column (0-2): "))
-        y = int(input("Enter row (0-2): "))
-        if 0 <= x <= 2 and 0 <= y <= 2:
-            if current_board[y][x] == EMPTY:
-                message = f"PLACE:{x}:{y}"
-                response = send_message(sock, message)
-                if response.startswith("BOARDSTATUS:"):
-                    current_turn = opposing_player
-                    handle_boardstatus(sock, response.split(":")[1])
-                elif response.startswith("GAMEEND:"):
-                    handle_gameend(sock, response)
+        try:
+            x = int(await prompt(f"Enter column (0-{last}): "))
+            y = int(await prompt(f"Enter row (0-{last}): "))
+        except ValueError:
+            print(f"(Column/Row) values must be an integer between 0 and {last}")
+            continue
+        if not your_turn.is_set():
+            #the game ended, or the opponent forfeited, while we were typing
+            return
+        if 0 <= x <= last and 0 <= y <= last:
+            if client.cell_empty(x, y):
+                your_turn.clear()
+                #the MOVE or GAMEEND this causes is also pushed, which prints the board
+                await client.place(x, y)
                 break
             else:
                 print(f"({x}, {y}) is already occupied.")
         else:
-            print("(Column/Row) values must be an integer between 0 and 2")
-
-
-opposing_player = ""
-current_turn = ""
-
-def handle_forfeit(sock: socket.socket) -> None:
-    global current_room
-    message = "FORFEIT"
-
-    response = send_message(sock, message)
-    handle_gameend(sock, response)
+            print(f"(Column/Row) values must be an integer between 0 and {last}")
 
-def handle_boardstatus(sock: socket.socket, board_status: str) -> None:
-    global current_board, is_player, username, current_turn, player1, player2
+async def handle_forfeit() -> None:
+    await client.forfeit()
 
-    for i, char in enumerate(board_status):
-        row = i // 3
-        col = i % 3
-        if char == '0':
-            current_board[row][col] = EMPTY
-        elif char == '1':
-            current_board[row][col] = CROSS
-        elif char == '2':
-            current_board[row][col] = NOUGHT
-
-    print_board(current_board)
-
-    current_turn = player2 if current_turn == player1 else player1
-
-    if is_player:
-        if current_turn == username:
-            print("It is your turn")
-            handle_place(sock)
-        else:
-            print(f"It is {current_turn}'s turn")
+def announce_turn(client: GameClient) -> None:
+    if client.my_turn:
+        print("It is your turn")
+        your_turn.set()
     else:
-        print(f"It is {current_turn}'s turn")
-
-def handle_gameend(sock: socket.socket, response: str) -> None:
-    global current_room, username, is_player
-    parts = response.split(":")
-    board_status = parts[1]
-    result = parts[2]
-    winner = parts[3] if len(parts) > 3 else None
-
-    handle_boardstatus(sock, board_status)
-
-    if is_player:
-        if result == "0":
-            if winner == username:
+        print(f"It is {client.current_turn}'s turn")
+        your_turn.clear()
+
+def show_begin(client: GameClient) -> None:
+    print(f"\nmatch between {client.player1} and {client.player2} will commence, it is currently {client.player1}'s turn.")
+    if client.is_player and client.username != client.player1:
+        print(f"Waiting for {client.player1} to place their first marker.")
+    if not client.my_turn:
+        announce_turn(client)
+
+def show_move(client: GameClient, x: int, y: int, symbol: str) -> None:
+    bitboard.print_board(client.board)
+    if not client.my_turn:
+        announce_turn(client)
+
+def show_board(client: GameClient) -> None:
+    print(f"\nmatch between {client.player1} and {client.player2} is in progress.")
+    bitboard.print_board(client.board)
+    if not client.my_turn:
+        announce_turn(client)
+
+def show_game_end(client: GameClient, result: int, winner: Optional[str]) -> None:
+    bitboard.print_board(client.board)
+    your_turn.clear()
+
+    if client.is_player:
+        if result == 0:
+            if winner == client.username:
                 print("Congratulations, you won!")
             else:
                 print(f"Sorry you lost. Good luck next time.")
-        elif result == "1":
+        elif result == 1:
             print("Game ended in a draw.")
-        elif result == "2":
-            if winner == username:
+        elif result == 2:
+            if winner == client.username:
                 print(f"You won due to the opposing player forfeiting.")
             else:
                 print(f"{winner} won due to the opposing player forfeiting.")
     else:  # Viewer
-        if result == "0":
+        if result == 0:
             print(f"{winner} has won this game.")
-        elif result == "1":
+        elif result == 1:
             print("Game ended in a draw.")
-        elif result == "2":
+        elif result == 2:
             print(f"{winner} won due to the opposing player forfeiting.")
-    
-    current_room = ""
-    is_player = False
-
-def send_message(sock: socket.socket, message: str) -> Optional[str]:
-    sock.sendall(message.encode('ascii'))
-    return sock.recv(8192).decode('ascii')
 
-def handle_user_input(sock: socket.socket) -> None:
-    global need_wait
+async def handle_user_input(server_address: str, port: int) -> None:
+    commands = {
+        "LOGIN": handle_login,
+        "REGISTER": handle_register,
+        "ROOMLIST": handle_roomlist,
+        "CREATE": handle_create,
+        "JOIN": handle_join,
+        "QUICKPLAY": handle_quickplay,
+        "PLACE": handle_place,
+        "FORFEIT": handle_forfeit,
+    }
     while True:
-        ready_to_read, _, _ = select.select([sock], [], [], 0.1)
-        if ready_to_read:
-            message = sock.recv(8192).decode('ascii')
-            if message:
-                handle_all_message(sock, message)
-
-        if not need_wait:
-            try:
-                command = input("Enter command: ").upper()
-                if command == "QUIT":
-                    print("Exiting...")
-                    return
-                elif command == "LOGIN":
-                    if handle_login(sock):
-                        continue
-                elif command == "REGISTER":
-                    handle_register(sock)
-                elif command == "ROOMLIST":
-                    if handle_roomlist(sock) == "BADAUTH":
-                        handle_all_message(sock, "BADAUTH")
-                        continue
-                elif command == "CREATE":
-                    if handle_create(sock) == "BADAUTH":
-                        handle_all_message(sock, "BADAUTH")
-                        continue
-                elif command == "JOIN":
-                    if handle_join(sock) == "BADAUTH":
-                        handle_all_message(sock, "BADAUTH")
-                        continue
-                elif command == "PLACE":
-                    handle_place(sock)
-                elif command == "FORFEIT":
-                    handle_forfeit(sock)
-                else:
-                    print(f"Unknown command: {command}")
-            except EOFError:
-                print("\nDebug: EOF detected, exiting gracefully")
+        try:
+            if your_turn.is_set():
+                await handle_place()
+                continue
+            #a BEGIN or MOVE push that makes it our turn cuts the command prompt short
+            command = await prompt("Enter command: ", your_turn)
+            if command is None:
+                continue
+            command = command.upper()
+            if command == "QUIT":
+                print("Exiting...")
+                return
+            if command not in commands:
+                print(f"Unknown command: {command}")
+                continue
+            await commands[command]()
+        except RequestError as e:
+            if e.reply == "BADAUTH":
+                print("Error: You must be logged in to perform this action.")
+            elif e.reply == "NOROOM":
+                print("Error: You are not in a game", file=sys.stderr)
+            else:
+                print(f"Error: Unexpected response from server: {e}", file=sys.stderr)
+        except EOFError:
+            print("\nDebug: EOF detected, exiting gracefully")
+            break
+        except ConnectionError:
+            if not await reconnect(server_address, port):
+                print("Connection closed by server")
                 break
-    
+
+async def reconnect(server_address: str, port: int) -> bool:
+    #a restarted server restores its rooms, so the session and its game can be picked up again
+    if not client.token:
+        return False
+    print("Connection lost, reconnecting...")
+    your_turn.clear()
+    for _ in range(RECONNECT_ATTEMPTS):
+        try:
+            status = await client.resume(server_address, port)
+        except OSError:
+            await asyncio.sleep(RECONNECT_DELAY)
+            continue
+        except RequestError:
+            return False
+        if status != 0:
+            return False
+        connection_lost.clear()
+        print("Reconnected")
+        #the INPROGRESS that follows the ack may already have set your_turn
+        return True
+    return False
+
+async def run(server_address: str, port: int, binary: bool) -> None:
+    global client, input_lines, your_turn, connection_lost
+
+    input_lines = asyncio.Queue()
+    your_turn = asyncio.Event()
+    connection_lost = asyncio.Event()
+    client = await GameClient.open(server_address, port)
+    client.on_begin = show_begin
+    client.on_move = show_move
+    client.on_board = show_board
+    client.on_turn = announce_turn
+    client.on_game_end = show_game_end
+    client.on_close = lambda client: connection_lost.set()
+    if binary and not await client.connection.negotiate_binary():
+        print("Error: Server does not support the binary protocol, using text", file=sys.stderr)
+    start_input_reader(asyncio.get_running_loop())
     try:
-        sock.shutdown(socket.SHUT_RDWR)
-    except OSError:
-        pass
-    sock.close()
-
-def handle_all_message(sock, message):
-    global need_wait, player1, player2, current_turn, username, is_player
-
-    if message.startswith("BOARDSTATUS"):
-        command, board_status = message.split(":")
-        handle_boardstatus(sock, board_status)
-    elif message.startswith("BEGIN"):
-        _, player1, player2 = message.split(":")
-        current_turn = player1
-        print(f"match between {player1} and {player2} will commence, it is currently {player1}'s turn.")
-        
-        if is_player:
-            if username == player1:
-                print("It's your turn. Place your first marker.")
-                handle_place(sock)
-            else:
-                print(f"Waiting for {player1} to place their first marker.")
-        need_wait = False
-    elif message.startswith("BADAUTH"):
-        print("Error: You must be logged in to perform this action.")
+        await handle_user_input(server_address, port)
+    finally:
+        await client.close()
 
 def main(args: List[str]):
-    if len(args) != 2:
-        print("Error: Expecting 2 arguments: <server address> <port>")
+    if len(args) not in (2, 3) or (len(args) == 3 and args[2] != "--binary"):
+        print("Error: Expecting 2 arguments: <server address> <port> [--binary]")
         sys.exit(1)
 
     server_address = args[0]
     port = int(args[1])
 
     try:
-        with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as s:
-            s.connect((server_address, port))
-            handle_user_input(s)
-            s.close()
+        asyncio.run(run(server_address, port, len(args) == 3))
     except ConnectionRefusedError:
         print(f"Error: cannot connect to server at {server_address} and {port}.")
         sys.exit(1)
 
 if __name__ == "__main__":
-    main(sys.argv[1:])
\ No newline at end of file
+    main(sys.argv[1:])
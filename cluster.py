@@ -0,0 +1,117 @@
+import os
+import sys
+import json
+import zlib
+import signal
+import socket
+from typing import Any, Callable, Dict, List, Optional, Tuple
+
+
+__all__ = [
+    "Cluster",
+    "run_workers"
+]
+
+
+MAX_CONTROL_MESSAGE = 1 << 20
+
+
+class Cluster:
+    """A worker's view of its pre-forked siblings.
+
+    Workers talk over AF_UNIX datagram socketpairs created before the fork:
+    datagrams sent on ``pairs[i][1]`` arrive on worker i's ``inbox``. A
+    client connection migrates between workers by passing its descriptor
+    with SCM_RIGHTS alongside a JSON description of its session state.
+    """
+
+    __slots__ = ('worker_id', 'n_workers', 'inbox', '_peers')
+
+    def __init__(self, worker_id: int, pairs: List[Tuple[socket.socket, socket.socket]]) -> None:
+        self.worker_id = worker_id
+        self.n_workers = len(pairs)
+        self.inbox = pairs[worker_id][0]
+        self.inbox.setblocking(False)
+        self._peers = [sender for _, sender in pairs]
+        for index, (receiver, _) in enumerate(pairs):
+            if index != worker_id:
+                receiver.close()
+
+    def shard_for(self, key: str) -> int:
+        """The worker that owns a room or username; stable across processes"""
+        return zlib.crc32(key.encode('ascii', 'replace')) % self.n_workers
+
+    def send(self, worker: int, payload: Dict[str, Any], fds: Optional[List[int]] = None) -> None:
+        data = json.dumps(payload).encode('ascii')
+        if fds:
+            socket.send_fds(self._peers[worker], [data], fds)
+        else:
+            self._peers[worker].send(data)
+
+    def broadcast(self, payload: Dict[str, Any]) -> None:
+        """Sends a payload to every other worker"""
+        data = json.dumps(payload).encode('ascii')
+        for worker, peer in enumerate(self._peers):
+            if worker != self.worker_id:
+                try:
+                    peer.send(data)
+                except BlockingIOError:
+                    # A sibling that is not draining its inbox misses this update; the next one supersedes it
+                    pass
+
+    def receive(self) -> Optional[Tuple[Dict[str, Any], List[int]]]:
+        """Returns the next (payload, descriptors) from a sibling, or None if there is none"""
+        try:
+            data, fds, _, _ = socket.recv_fds(self.inbox, MAX_CONTROL_MESSAGE, 1)
+        except BlockingIOError:
+            return None
+        return json.loads(data), fds
+
+
+def run_workers(n_workers: int, target: Callable[[Cluster], None]) -> None:
+    """Forks n_workers processes running target and waits for them to exit"""
+    pairs = [socket.socketpair(socket.AF_UNIX, socket.SOCK_DGRAM) for _ in range(n_workers)]
+    for _, sender in pairs:
+        sender.setblocking(False)
+
+    children = []
+    for worker_id in range(n_workers):
+        pid = os.fork()
+        if pid == 0:
+            signal.signal(signal.SIGINT, signal.default_int_handler)
+            status = 0
+            try:
+                target(Cluster(worker_id, pairs))
+            except SystemExit as e:
+                status = e.code if isinstance(e.code, int) else 1
+            except BaseException:
+                import traceback
+                traceback.print_exc()
+                status = 1
+            finally:
+                sys.stdout.flush()
+                os._exit(status)
+        children.append(pid)
+
+    for receiver, sender in pairs:
+        receiver.close()
+        sender.close()
+
+    def forward(signum, frame):
+        for pid in children:
+            try:
+                os.kill(pid, signum)
+            except ProcessLookupError:
+                pass
+
+    signal.signal(signal.SIGINT, forward)
+    signal.signal(signal.SIGTERM, forward)
+    for pid in children:
+        while True:
+            try:
+                os.waitpid(pid, 0)
+                break
+            except InterruptedError:
+                continue
+            except ChildProcessError:
+                break
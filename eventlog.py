@@ -0,0 +1,186 @@
+import sys
+import json
+import struct
+from array import array
+from typing import BinaryIO, Iterator, List, NamedTuple, Optional
+
+from game import CROSS, NOUGHT
+from bitboard import Bitboard, create_board, place, print_board, board_to_string
+
+
+__all__ = [
+    "RESULT_WIN",
+    "RESULT_DRAW",
+    "RESULT_FORFEIT",
+    "ArchivedGame",
+    "GameArchive",
+    "new_move_log",
+    "moves_to_bytes",
+    "moves_from_bytes",
+    "read_exactly",
+    "read_games",
+    "replay"
+]
+
+
+# Results as sent in GAMEEND messages
+RESULT_WIN = 0
+RESULT_DRAW = 1
+RESULT_FORFEIT = 2
+
+MAGIC = b'TTTA\x01'
+# size, win length, result, winner seat (NO_WINNER for a draw), move count
+RECORD_HEADER = struct.Struct('<BBBBH')
+NO_WINNER = 0xff
+
+
+class ArchivedGame(NamedTuple):
+    size: int
+    win_length: int
+    players: List[str]
+    result: int
+    winner: Optional[str]
+    moves: array
+
+
+#############################################################
+############### Private functions—do not use! ###############
+#############################################################
+
+def _read_name(f: BinaryIO) -> Optional[str]:
+    length = read_exactly(f, 1)
+    if length is None:
+        return None
+    name = read_exactly(f, length[0])
+    return None if name is None else name.decode('ascii')
+
+##########################################################
+############### Public functions—use these ###############
+##########################################################
+
+def new_move_log() -> array:
+    """An empty move log: one unsigned 16-bit cell index (y * size + x) per move, crosses first"""
+    return array('H')
+
+
+def moves_to_bytes(moves: array) -> bytes:
+    """Encodes a move log as little-endian 16-bit cells, whatever the host byte order"""
+    if sys.byteorder == 'big':
+        moves = array('H', moves)
+        moves.byteswap()
+    return moves.tobytes()
+
+
+def moves_from_bytes(data: bytes) -> array:
+    """Inverse of moves_to_bytes"""
+    moves = new_move_log()
+    moves.frombytes(data)
+    if sys.byteorder == 'big':
+        moves.byteswap()
+    return moves
+
+
+def read_exactly(f: BinaryIO, n: int) -> Optional[bytes]:
+    """Reads n bytes, or returns None if the file ends first, as it does after a torn write"""
+    data = f.read(n)
+    return data if len(data) == n else None
+
+
+class GameArchive:
+    """Append-only binary archive of finished games.
+
+    The file starts with a magic string and holds one record per game: a
+    fixed header, the two player names, then the move log. Records are
+    written whole and flushed, so a reader sees every game archived so far.
+    """
+
+    __slots__ = ('path', '_file')
+
+    def __init__(self, path: str) -> None:
+        self.path = path
+        self._file = open(path, 'ab')
+        if self._file.tell() == 0:
+            self._file.write(MAGIC)
+
+    def append(self, size: int, win_length: int, players: List[str], result: int,
+               winner: Optional[str], moves: array) -> None:
+        """Archives one finished game; players are in seat order, crosses first"""
+        winner_seat = players.index(winner) if winner in players else NO_WINNER
+        record = bytearray(RECORD_HEADER.pack(size, win_length, result, winner_seat, len(moves)))
+        for name in players:
+            # Names have a one-byte length; the server caps new ones far below it, so only older users are clipped
+            encoded = name.encode('ascii')[:0xff]
+            record.append(len(encoded))
+            record += encoded
+        record += moves_to_bytes(moves)
+        self._file.write(record)
+        self._file.flush()
+
+    def close(self) -> None:
+        self._file.close()
+
+
+def read_games(path: str) -> Iterator[ArchivedGame]:
+    """Streams the games in an archive, one record in memory at a time"""
+    with open(path, 'rb') as f:
+        if f.read(len(MAGIC)) != MAGIC:
+            raise ValueError(f"{path} is not a game archive")
+        while (header := read_exactly(f, RECORD_HEADER.size)) is not None:
+            size, win_length, result, winner_seat, n_moves = RECORD_HEADER.unpack(header)
+            players = [_read_name(f), _read_name(f)]
+            data = read_exactly(f, 2 * n_moves)
+            if None in players or data is None:
+                # A record torn by a crash mid-write
+                return
+            moves = moves_from_bytes(data)
+            winner = players[winner_seat] if winner_seat != NO_WINNER else None
+            yield ArchivedGame(size, win_length, players, result, winner, moves)
+
+
+def replay(size: int, win_length: int, moves: array) -> Iterator[Bitboard]:
+    """Yields the board after each move of a move log"""
+    board = create_board(size, win_length)
+    for turn, cell in enumerate(moves):
+        place(CROSS if turn % 2 == 0 else NOUGHT, board, cell % size, cell // size)
+        yield board
+
+
+def main(args: List[str]) -> None:
+    if len(args) < 2 or args[0] not in ('export', 'replay'):
+        print("Usage: eventlog.py export <archive>...  (one JSON object per game)")
+        print("       eventlog.py replay <archive> <game number>")
+        sys.exit(1)
+
+    if args[0] == 'export':
+        for path in args[1:]:
+            for game in read_games(path):
+                board = create_board(game.size, game.win_length)
+                for board in replay(game.size, game.win_length, game.moves):
+                    pass
+                print(json.dumps({
+                    "size": game.size,
+                    "winLength": game.win_length,
+                    "players": game.players,
+                    "result": game.result,
+                    "winner": game.winner,
+                    "moves": [[cell % game.size, cell // game.size] for cell in game.moves],
+                    "board": board_to_string(board)
+                }))
+        return
+
+    if len(args) != 3:
+        print("Error: replay expects <archive> <game number>")
+        sys.exit(1)
+    for index, game in enumerate(read_games(args[1])):
+        if index == int(args[2]):
+            print(f"{game.players[0]} ({CROSS}) vs {game.players[1]} ({NOUGHT})")
+            for board in replay(game.size, game.win_length, game.moves):
+                print_board(board)
+            print(f"Winner: {game.winner}" if game.winner else "Draw")
+            return
+    print(f"Error: {args[1]} has no game {args[2]}")
+    sys.exit(1)
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
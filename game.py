@@ -9,7 +9,8 @@ __all__ = [
     "print_board",
     "player_turn",
     "player_wins",
-    "players_draw"
+    "players_draw",
+    "best_move"
 ]
 __author__ = "Luca Napoli"
 
@@ -19,7 +20,6 @@ CELL_SIZE = 5
 
 ROW_SEPARATOR = '-'
 COLUMN_SEPARATOR = '|'
-N_ROW_SEPARATORS = CELL_SIZE + (CELL_SIZE - 1) * (BOARD_SIZE - 1)
 
 NOUGHT = 'O'
 CROSS = 'X'
@@ -32,41 +32,45 @@ Board = list[list[str]]
 #############################################################
 
 def _player_wins_vertically(player: str, board: Board) -> bool:
+    size = len(board)
     return any(
-        all(board[y][x] == player for y in range(BOARD_SIZE)) 
-        for x in range(BOARD_SIZE)
+        all(board[y][x] == player for y in range(size)) 
+        for x in range(size)
     )
 
 
 def _player_wins_horizontally(player: str, board: Board) -> bool:
+    size = len(board)
     return any(
-        all(board[x][y] == player for y in range(BOARD_SIZE)) 
-        for x in range(BOARD_SIZE)
+        all(board[x][y] == player for y in range(size)) 
+        for x in range(size)
     )
 
 
 def _player_wins_diagonally(player: str, board: Board) -> bool:
+    size = len(board)
     return (
-        all(board[y][y] == player for y in range(BOARD_SIZE)) or
-        all(board[BOARD_SIZE - 1 - y][y] == player for y in range(BOARD_SIZE))
+        all(board[y][y] == player for y in range(size)) or
+        all(board[size - 1 - y][y] == player for y in range(size))
     )
 
 
-def _try_read_value(prompt: str) -> Optional[int]:
+def _try_read_value(prompt: str, size: int) -> Optional[int]:
     try:
         value = int(input(prompt))
     except ValueError:
         return None
-    return value if 1 <= value < BOARD_SIZE + 1 else None
+    return value if 1 <= value < size + 1 else None
 
 
 def _empty_board_position(board: Board) -> tuple[int, int]:
+    size = len(board)
     while True:
-        while (column := _try_read_value(f"Column: ")) is None:
-            print(f"Column values must be between 1 and {BOARD_SIZE}")
+        while (column := _try_read_value(f"Column: ", size)) is None:
+            print(f"Column values must be between 1 and {size}")
 
-        while (row := _try_read_value(f"Row: ")) is None:
-            print(f"Row values must be between 1 and {BOARD_SIZE}")
+        while (row := _try_read_value(f"Row: ", size)) is None:
+            print(f"Row values must be between 1 and {size}")
 
         x = column - 1
         y = row - 1
@@ -78,19 +82,20 @@ def _empty_board_position(board: Board) -> tuple[int, int]:
 ############### Public functions—use these ###############
 ##########################################################
 
-def create_board() -> Board:
+def create_board(size: int = BOARD_SIZE) -> Board:
     """Create a new board"""
-    return [[EMPTY for _ in range(BOARD_SIZE)] for _ in range(BOARD_SIZE)]
+    return [[EMPTY for _ in range(size)] for _ in range(size)]
 
 
 def print_board(board: Board):
     """Print the board"""
-    print(ROW_SEPARATOR * N_ROW_SEPARATORS)
+    n_row_separators = CELL_SIZE + (CELL_SIZE - 1) * (len(board) - 1)
+    print(ROW_SEPARATOR * n_row_separators)
     for row in board:
         for value in row:
             print(f"{COLUMN_SEPARATOR} {value} ", end='')
         print(COLUMN_SEPARATOR)
-        print(ROW_SEPARATOR * N_ROW_SEPARATORS)
+        print(ROW_SEPARATOR * n_row_separators)
 
 
 def player_turn(player: str, board: Board) -> tuple[int, int]:
@@ -112,7 +117,15 @@ def player_wins(player: str, board: Board) -> bool:
 def players_draw(board: Board) -> bool:
     """Determines whether the players draw on the given board"""
     return all(
-        board[y][x] != EMPTY 
-        for y in range(BOARD_SIZE) 
-        for x in range(BOARD_SIZE)
+        value != EMPTY 
+        for row in board 
+        for value in row
     )
+
+
+def best_move(player: str, board: Board) -> Optional[tuple[int, int]]:
+    """Returns the (column, row) indices of a perfect move for the player, or None if the game is over"""
+    # Imported here because the solver is built on bitboard, which imports this module
+    from bitboard import from_board
+    from solver import best_move as solve_best_move
+    return solve_best_move(player, from_board(board))
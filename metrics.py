@@ -0,0 +1,162 @@
+import signal
+from bisect import bisect_left
+from collections import Counter as _StackCounter
+from typing import Callable, Dict, List, Optional, Tuple
+
+
+__all__ = [
+    "Counter",
+    "Gauge",
+    "Histogram",
+    "SamplingProfiler",
+    "render"
+]
+
+
+# Upper bounds in seconds, suited to anything from a dict lookup to a bcrypt hash
+LATENCY_BUCKETS = (0.00001, 0.00005, 0.0001, 0.0005, 0.001, 0.005, 0.01, 0.05, 0.1, 0.5, 1.0, 5.0)
+SIZE_BUCKETS = (0, 1, 2, 4, 8, 16, 32, 64, 128, 256)
+
+_REGISTRY: List['_Metric'] = []
+
+#############################################################
+############### Private functions—do not use! ###############
+#############################################################
+
+class _Metric:
+    __slots__ = ('name', 'help')
+    kind = ''
+
+    def __init__(self, name: str, help: str) -> None:
+        self.name = name
+        self.help = help
+        _REGISTRY.append(self)
+
+    def samples(self) -> List[Tuple[str, float]]:
+        raise NotImplementedError
+
+
+def _format_value(value: float) -> str:
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+##########################################################
+############### Public functions—use these ###############
+##########################################################
+
+class Counter(_Metric):
+    """A monotonically increasing count, optionally split by one label"""
+
+    __slots__ = ('label', '_values')
+    kind = 'counter'
+
+    def __init__(self, name: str, help: str, label: Optional[str] = None) -> None:
+        super().__init__(name, help)
+        self.label = label
+        self._values: Dict[Optional[str], float] = {}
+
+    def inc(self, amount: float = 1, label_value: Optional[str] = None) -> None:
+        self._values[label_value] = self._values.get(label_value, 0) + amount
+
+    def value(self, label_value: Optional[str] = None) -> float:
+        return self._values.get(label_value, 0)
+
+    def samples(self) -> List[Tuple[str, float]]:
+        if self.label is None:
+            return [(self.name, self._values.get(None, 0))]
+        return [(f'{self.name}{{{self.label}="{label_value}"}}', value)
+                for label_value, value in sorted(self._values.items())]
+
+
+class Gauge(_Metric):
+    """A value read when the metrics are rendered, so keeping it current costs nothing"""
+
+    __slots__ = ('read',)
+    kind = 'gauge'
+
+    def __init__(self, name: str, help: str, read: Callable[[], float]) -> None:
+        super().__init__(name, help)
+        self.read = read
+
+    def samples(self) -> List[Tuple[str, float]]:
+        return [(self.name, self.read())]
+
+
+class Histogram(_Metric):
+    """Counts of observations in fixed buckets, plus their sum and count"""
+
+    __slots__ = ('buckets', '_counts', '_sum')
+    kind = 'histogram'
+
+    def __init__(self, name: str, help: str, buckets: Tuple[float, ...] = LATENCY_BUCKETS) -> None:
+        super().__init__(name, help)
+        self.buckets = buckets
+        # One slot per bucket plus the overflow; made cumulative only when rendered
+        self._counts = [0] * (len(buckets) + 1)
+        self._sum = 0.0
+
+    def observe(self, value: float) -> None:
+        self._counts[bisect_left(self.buckets, value)] += 1
+        self._sum += value
+
+    def samples(self) -> List[Tuple[str, float]]:
+        samples = []
+        cumulative = 0
+        for bound, count in zip(self.buckets + (float('inf'),), self._counts):
+            cumulative += count
+            samples.append((f'{self.name}_bucket{{le="{_format_value(bound)}"}}', cumulative))
+        samples.append((f'{self.name}_sum', self._sum))
+        samples.append((f'{self.name}_count', cumulative))
+        return samples
+
+
+def render() -> str:
+    """Every registered metric in the Prometheus text exposition format"""
+    lines = []
+    for metric in _REGISTRY:
+        lines.append(f'# HELP {metric.name} {metric.help}')
+        lines.append(f'# TYPE {metric.name} {metric.kind}')
+        for name, value in metric.samples():
+            lines.append(f'{name} {_format_value(value)}')
+    return '\n'.join(lines) + '\n'
+
+
+class SamplingProfiler:
+    """Statistical CPU profiler that samples the main thread's stack on SIGPROF.
+
+    Nothing is installed until ``start``, so it costs nothing while off.
+    ``stop`` returns the samples as collapsed stacks (one
+    ``outer;...;inner count`` line per distinct stack), the input format of
+    flame graph tools.
+    """
+
+    __slots__ = ('interval', '_stacks', 'running')
+
+    def __init__(self, interval: float = 0.005) -> None:
+        self.interval = interval
+        self._stacks: _StackCounter = _StackCounter()
+        self.running = False
+
+    def start(self) -> None:
+        if self.running or not hasattr(signal, 'setitimer'):
+            return
+        self._stacks.clear()
+        signal.signal(signal.SIGPROF, self._sample)
+        signal.setitimer(signal.ITIMER_PROF, self.interval, self.interval)
+        self.running = True
+
+    def stop(self) -> str:
+        if self.running:
+            signal.setitimer(signal.ITIMER_PROF, 0, 0)
+            signal.signal(signal.SIGPROF, signal.SIG_DFL)
+            self.running = False
+        return ''.join(f'{stack} {count}\n' for stack, count in self._stacks.most_common())
+
+    def _sample(self, signum, frame) -> None:
+        stack = []
+        while frame is not None:
+            code = frame.f_code
+            stack.append(f'{code.co_name} ({code.co_filename.rsplit("/", 1)[-1]}:{code.co_firstlineno})')
+            frame = frame.f_back
+        self._stacks[';'.join(reversed(stack))] += 1
@@ -0,0 +1,244 @@
+from collections import deque
+from typing import Optional, List, Tuple
+
+from game import CROSS, NOUGHT
+from bitboard import Bitboard, board_size, win_length, to_packed, from_packed, board_to_string
+
+
+__all__ = [
+    "DELIMITER",
+    "MAX_MESSAGE_LENGTH",
+    "ProtocolError",
+    "MessageBuffer",
+    "BinaryMessageBuffer",
+    "frame",
+    "encode_text",
+    "encode_begin",
+    "encode_move",
+    "encode_board_status",
+    "encode_game_end",
+    "encode_in_progress"
+]
+
+
+# Every message on the wire is ASCII text terminated by a newline
+DELIMITER = b'\n'
+MAX_MESSAGE_LENGTH = 8192
+
+# In binary mode (negotiated with PROTO:BINARY) each server message is an
+# opcode byte and a body. Names and text are varint-length prefixed, and
+# boards are a size byte followed by bitboard.to_packed output.
+OP_TEXT = 0x00          # any other message, as its text form
+OP_BEGIN = 0x01         # player 1, player 2, board size byte, win length byte
+OP_BOARD_STATUS = 0x02  # board
+OP_GAME_END = 0x03      # result byte, board, winner ('' for a draw)
+OP_IN_PROGRESS = 0x04   # current player, opposing player, board, move sequence number, win length byte
+OP_MOVE = 0x05          # move sequence number, x byte, y byte, symbol byte (1 cross, 2 nought)
+
+_SYMBOL_CODES = {CROSS: 1, NOUGHT: 2}
+_CODE_SYMBOLS = {1: CROSS, 2: NOUGHT}
+
+
+class ProtocolError(ValueError):
+    """Raised when a peer sends data that cannot be framed"""
+
+
+def frame(message: str) -> bytes:
+    """Encodes a message for the wire"""
+    return message.encode('ascii') + DELIMITER
+
+
+def _varint(value: int) -> bytes:
+    """Unsigned LEB128: 7 bits per byte, high bit set on all but the last"""
+    encoded = bytearray()
+    while value > 0x7f:
+        encoded.append(value & 0x7f | 0x80)
+        value >>= 7
+    encoded.append(value)
+    return bytes(encoded)
+
+
+def _string(value: str) -> bytes:
+    encoded = value.encode('ascii')
+    return _varint(len(encoded)) + encoded
+
+
+def _board(board: Bitboard) -> bytes:
+    return bytes((board_size(board),)) + to_packed(board)
+
+
+def encode_text(message: str) -> bytes:
+    """Wraps a message without a binary form for a binary-mode client"""
+    return bytes((OP_TEXT,)) + _string(message)
+
+
+def encode_begin(player1: str, player2: str, size: int, win_length: int) -> bytes:
+    return bytes((OP_BEGIN,)) + _string(player1) + _string(player2) + bytes((size, win_length))
+
+
+def encode_move(seq: int, x: int, y: int, symbol: str) -> bytes:
+    return bytes((OP_MOVE,)) + _varint(seq) + bytes((x, y, _SYMBOL_CODES[symbol]))
+
+
+def encode_board_status(board: Bitboard) -> bytes:
+    return bytes((OP_BOARD_STATUS,)) + _board(board)
+
+
+def encode_game_end(board: Bitboard, result: int, winner: Optional[str]) -> bytes:
+    return bytes((OP_GAME_END, result)) + _board(board) + _string(winner or '')
+
+
+def encode_in_progress(current_player: str, opposing_player: str, board: Bitboard, seq: int) -> bytes:
+    return (bytes((OP_IN_PROGRESS,)) + _string(current_player) + _string(opposing_player)
+            + _board(board) + _varint(seq) + bytes((win_length(board),)))
+
+
+class MessageBuffer:
+    """Incremental parser that splits a byte stream into framed messages.
+
+    A single read may carry several pipelined messages and a partial one;
+    complete messages are queued for ``pop`` and the partial tail is kept
+    until the rest of it arrives.
+    """
+
+    __slots__ = ('_partial', '_messages')
+
+    def __init__(self) -> None:
+        self._partial = bytearray()
+        self._messages: deque[bytes] = deque()
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def feed(self, data: bytes) -> None:
+        """Adds bytes read from the connection"""
+        # Everything downstream encodes back to ASCII, so anything else is refused at the door
+        if not data.isascii():
+            raise ProtocolError("message is not ASCII")
+        if DELIMITER not in data:
+            self._partial += data
+        else:
+            lines = (bytes(self._partial) + data).split(DELIMITER)
+            self._partial = bytearray(lines.pop())
+            self._messages.extend(line for line in lines if line.strip())
+        if len(self._partial) > MAX_MESSAGE_LENGTH:
+            raise ProtocolError(f"message exceeds {MAX_MESSAGE_LENGTH} bytes")
+
+    def pop(self) -> Optional[str]:
+        """Returns the next complete message, or None if there is none yet"""
+        if not self._messages:
+            return None
+        return self._messages.popleft().rstrip(b'\r').decode('ascii')
+
+    def peek(self) -> Optional[str]:
+        """Returns the next complete message without removing it"""
+        if not self._messages:
+            return None
+        return self._messages[0].rstrip(b'\r').decode('ascii')
+
+    def drain(self) -> Tuple[List[str], bytes]:
+        """Removes and returns every queued message and the partial tail"""
+        messages = [message.rstrip(b'\r').decode('ascii') for message in self._messages]
+        partial = bytes(self._partial)
+        self._messages.clear()
+        self._partial.clear()
+        return messages, partial
+
+
+class _Incomplete(Exception):
+    pass
+
+
+class BinaryMessageBuffer:
+    """Parses a binary-mode server stream back into the equivalent text messages.
+
+    It has the same interface as MessageBuffer, so a client can swap it in
+    once PROTO:BINARY is acknowledged and keep its text handlers.
+    """
+
+    __slots__ = ('_data', '_messages')
+
+    def __init__(self) -> None:
+        self._data = bytearray()
+        self._messages: deque[str] = deque()
+
+    def __len__(self) -> int:
+        return len(self._messages)
+
+    def feed(self, data: bytes) -> None:
+        self._data += data
+        offset = 0
+        while offset < len(self._data):
+            try:
+                message, offset = self._parse(offset)
+            except _Incomplete:
+                break
+            self._messages.append(message)
+        del self._data[:offset]
+        if len(self._data) > MAX_MESSAGE_LENGTH:
+            raise ProtocolError(f"message exceeds {MAX_MESSAGE_LENGTH} bytes")
+
+    def pop(self) -> Optional[str]:
+        if not self._messages:
+            return None
+        return self._messages.popleft()
+
+    def _byte(self, offset: int) -> Tuple[int, int]:
+        if offset >= len(self._data):
+            raise _Incomplete()
+        return self._data[offset], offset + 1
+
+    def _varint(self, offset: int) -> Tuple[int, int]:
+        value = shift = 0
+        while True:
+            byte, offset = self._byte(offset)
+            value |= (byte & 0x7f) << shift
+            shift += 7
+            if not byte & 0x80:
+                return value, offset
+
+    def _string(self, offset: int) -> Tuple[str, int]:
+        length, offset = self._varint(offset)
+        if offset + length > len(self._data):
+            raise _Incomplete()
+        return self._data[offset:offset + length].decode('ascii', 'replace'), offset + length
+
+    def _board(self, offset: int) -> Tuple[str, int]:
+        size, offset = self._byte(offset)
+        end = offset + (size * size + 3) // 4
+        if end > len(self._data):
+            raise _Incomplete()
+        return board_to_string(from_packed(bytes(self._data[offset:end]), size)), end
+
+    def _parse(self, offset: int) -> Tuple[str, int]:
+        opcode, offset = self._byte(offset)
+        if opcode == OP_TEXT:
+            return self._string(offset)
+        if opcode == OP_BEGIN:
+            player1, offset = self._string(offset)
+            player2, offset = self._string(offset)
+            size, offset = self._byte(offset)
+            length, offset = self._byte(offset)
+            return f"BEGIN:{player1}:{player2}:{size}:{length}", offset
+        if opcode == OP_MOVE:
+            seq, offset = self._varint(offset)
+            x, offset = self._byte(offset)
+            y, offset = self._byte(offset)
+            symbol, offset = self._byte(offset)
+            return f"MOVE:{seq}:{x}:{y}:{_CODE_SYMBOLS.get(symbol, '?')}", offset
+        if opcode == OP_BOARD_STATUS:
+            board, offset = self._board(offset)
+            return f"BOARDSTATUS:{board}", offset
+        if opcode == OP_GAME_END:
+            result, offset = self._byte(offset)
+            board, offset = self._board(offset)
+            winner, offset = self._string(offset)
+            return f"GAMEEND:{board}:{result}:{winner}" if winner else f"GAMEEND:{board}:{result}", offset
+        if opcode == OP_IN_PROGRESS:
+            current_player, offset = self._string(offset)
+            opposing_player, offset = self._string(offset)
+            board, offset = self._board(offset)
+            seq, offset = self._varint(offset)
+            length, offset = self._byte(offset)
+            return f"INPROGRESS:{current_player}:{opposing_player}:{board}:{seq}:{length}", offset
+        raise ProtocolError(f"unknown opcode {opcode}")
@@ -0,0 +1,71 @@
+from typing import Dict
+
+
+__all__ = [
+    "TokenBucket",
+    "BucketTable"
+]
+
+
+class TokenBucket:
+    """Allows ``rate`` units per second on average and bursts of up to ``burst``.
+
+    Time is passed in by the caller (time.monotonic()), so one clock read
+    serves every bucket a command is charged to.
+    """
+
+    __slots__ = ('rate', 'burst', 'tokens', 'updated')
+
+    def __init__(self, rate: float, burst: float, now: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self.tokens = burst
+        self.updated = now
+
+    def _refill(self, now: float) -> None:
+        self.tokens = min(self.burst, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+    def delay(self, cost: float, now: float) -> float:
+        """Seconds until cost tokens are available; 0 if they are now"""
+        self._refill(now)
+        cost = min(cost, self.burst)
+        if self.tokens >= cost:
+            return 0.0
+        return (cost - self.tokens) / self.rate
+
+    def take(self, cost: float) -> None:
+        """Spends tokens after delay() has returned 0"""
+        self.tokens -= min(cost, self.burst)
+
+    def full(self, now: float) -> bool:
+        self._refill(now)
+        return self.tokens >= self.burst
+
+
+class BucketTable:
+    """Token buckets keyed by client address, created on first use.
+
+    A full bucket is indistinguishable from a new one, so ``prune`` drops
+    them to keep the table the size of the set of recently active clients.
+    """
+
+    __slots__ = ('rate', 'burst', '_buckets')
+
+    def __init__(self, rate: float, burst: float) -> None:
+        self.rate = rate
+        self.burst = burst
+        self._buckets: Dict[str, TokenBucket] = {}
+
+    def __len__(self) -> int:
+        return len(self._buckets)
+
+    def get(self, key: str, now: float) -> TokenBucket:
+        bucket = self._buckets.get(key)
+        if bucket is None:
+            bucket = self._buckets[key] = TokenBucket(self.rate, self.burst, now)
+        return bucket
+
+    def prune(self, now: float) -> None:
+        for key in [key for key, bucket in self._buckets.items() if bucket.full(now)]:
+            del self._buckets[key]
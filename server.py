@@ -1,19 +1,198 @@
 import sys
 import os
 import socket
-import select
+import selectors
 import json
-from typing import Dict, List, Any
+import time
+import secrets
+from collections import deque, OrderedDict
+from concurrent.futures import Executor, Future, ThreadPoolExecutor, ProcessPoolExecutor
+from itertools import chain, count, islice
+from typing import Dict, List, Any, Optional, Callable, Union
 
-import bcrypt
+from game import BOARD_SIZE, CROSS, NOUGHT
+from userstore import JOURNAL_SUFFIX, UserStore, find_user, iter_users
+import protocol
+from protocol import MessageBuffer, ProtocolError, frame
+from bitboard import MAX_BOARD_SIZE, create_board, board_size, win_length as board_win_length, place, player_wins, players_draw, board_to_string as bitboard_to_string
+import solver
+import cluster
+import eventlog
+import metrics
+from ratelimit import TokenBucket, BucketTable
+import statestore
+from timerwheel import Timer, TimerWheel
 
-from game import create_board, player_wins, players_draw, CROSS, NOUGHT, EMPTY
-
-ROOMS: Dict[str, Dict[str, Any]] = {}
-AUTHENTICATED_CLIENTS: Dict[socket.socket, str] = {}
-CLIENT_ROOMS: Dict[socket.socket, str] = {}
+ROOMS: Dict[str, 'Room'] = {}
+# Rooms with a free player seat, in creation order (a dict used as an ordered set)
+JOINABLE_ROOMS: Dict[str, None] = {}
+# Serialized ROOMLIST responses per (mode, binary), dropped whenever either room index changes
+ROOMLIST_CACHE: Dict[tuple, bytes] = {}
+# In multi-worker mode: this worker's view of its siblings, and their last published room lists
+CLUSTER: Optional[cluster.Cluster] = None
+REMOTE_ROOMS: Dict[int, Dict[str, List[str]]] = {}
+ROOMS_CHANGED = False
+SESSIONS: Dict[socket.socket, 'Session'] = {}
+# Session tokens handed out at login; a detached session stays here until its grace window ends
+TOKENS: Dict[str, 'Session'] = {}
+RESUME_GRACE = 30.0
+# Rooms of finished games, reset and reused by create_room
+ROOM_POOL: List['Room'] = []
+SELECTOR: Optional[selectors.BaseSelector] = None
+HASH_POOL: Optional[Executor] = None
+BCRYPT_ROUNDS = 12
+# bcrypt only looks at the first 72 bytes and newer versions refuse anything longer
+MAX_PASSWORD_LENGTH = 72
+CALLBACKS: deque = deque()
+WAKEUP_SOCKETS: Optional[tuple] = None
 MAX_ROOMS = 256
 MAX_ROOM_NAME_LENGTH = 20
+# Names are length-prefixed with a single byte in the game archive, so they must stay well short of that
+MAX_USERNAME_LENGTH = 32
+MAX_ROOMLIST_PAGE = 256
+MAX_POOLED_ROOMS = 1024
+MIN_WIN_LENGTH = 3
+MAX_IOVECS = 64
+# Commands handled per connection per loop iteration before other connections get a turn
+MAX_COMMANDS_PER_TURN = 16
+# A connection with this much unsent output is not read from until it drains
+OUTBOUND_HIGH_WATER = 256 * 1024
+# A connection this far behind, such as a stalled viewer of a busy room, is dropped instead
+OUTBOUND_HARD_LIMIT = 4 * 1024 * 1024
+# Token-bucket limits on commands per second, per connection and per client IP (None disables)
+COMMAND_RATE: Optional[float] = 50.0
+COMMAND_BURST = 100.0
+IP_COMMAND_RATE: Optional[float] = 500.0
+IP_COMMAND_BURST = 1000.0
+# Commands that start a bcrypt hash use up this many tokens
+COMMAND_COSTS = {"LOGIN": 10, "REGISTER": 10}
+IP_BUCKETS: Optional[BucketTable] = None
+IP_BUCKET_PRUNE_INTERVAL = 60.0
+# Seconds before retrying a handoff that found the sibling's inbox full or replies still queued
+HANDOFF_RETRY_DELAY = 0.05
+# Seconds a listener stops accepting after accept() fails, usually for want of file descriptors
+ACCEPT_RETRY_DELAY = 0.1
+# Seconds a metrics connection has to send its request and read the response
+METRICS_TIMEOUT = 10.0
+# Connections that hit MAX_COMMANDS_PER_TURN with commands left over, in the order they get their next turn
+PENDING_SESSIONS: deque = deque()
+BOT_USERNAME = "BOT"
+# Finished games are appended here when the config names a gameArchive
+GAME_ARCHIVE: Optional[eventlog.GameArchive] = None
+# When the config names a stateDir, every room change is logged here so a restart can restore the rooms
+STATE_STORE: Optional[statestore.StateStore] = None
+SNAPSHOT_INTERVAL = 60.0
+# Every timer (resume grace, QUICKPLAY, throttling, heartbeats, turns) lives on one wheel of 50 ms ticks
+TIMERS = TimerWheel()
+# A connection is sent PING after PING_INTERVAL seconds without input, and closed after IDLE_TIMEOUT
+PING_INTERVAL: Optional[float] = 30.0
+IDLE_TIMEOUT: Optional[float] = 90.0
+# Seconds a player has to move before forfeiting (None waits forever)
+TURN_TIMEOUT: Optional[float] = 120.0
+# Players waiting for QUICKPLAY, oldest first, each with its bot-fallback timer
+QUICKPLAY_QUEUE: 'OrderedDict[Session, Optional[Timer]]' = OrderedDict()
+QUICKPLAY_TIMEOUT: Optional[float] = 10.0
+QUICKPLAY_ROOMS = count(1)
+# In multi-worker mode every QUICKPLAY is matched on this worker so the whole queue is in one place
+MATCHMAKING_WORKER = 0
+PROFILER = metrics.SamplingProfiler()
+# Anything else is counted as INVALID so a misbehaving client cannot grow the label set
+KNOWN_COMMANDS = {"PROTO", "LOGIN", "REGISTER", "RESUME", "CREATE", "JOIN", "ROOMLIST", "ADDBOT", "QUICKPLAY", "PLACE",
+                  "FORFEIT", "RESYNC", "PING", "PONG"}
+
+COMMANDS = metrics.Counter('tictactoe_commands_total', "Commands received, by command", 'command')
+COMMAND_SECONDS = metrics.Histogram('tictactoe_command_seconds', "Time spent in handle_client_message")
+HASH_SECONDS = metrics.Histogram('tictactoe_bcrypt_seconds', "Time from submitting a bcrypt job to its result, queueing included")
+BROADCAST_FANOUT = metrics.Histogram('tictactoe_broadcast_recipients', "Connections each room broadcast is sent to", metrics.SIZE_BUCKETS)
+BYTES_IN = metrics.Counter('tictactoe_received_bytes_total', "Bytes read from clients")
+BYTES_OUT = metrics.Counter('tictactoe_sent_bytes_total', "Bytes written to clients")
+LOOP_SECONDS = metrics.Histogram('tictactoe_loop_iteration_seconds', "Time spent handling one batch of ready events")
+THROTTLED = metrics.Counter('tictactoe_throttled_total', "Times a connection was paused for exceeding its rate limit")
+TIMER_LAG = metrics.Histogram('tictactoe_timer_lag_seconds', "How late timers fire after their deadline")
+REAPED = metrics.Counter('tictactoe_idle_closed_total', "Connections closed for sending nothing for idleTimeout seconds")
+TURN_TIMEOUTS = metrics.Counter('tictactoe_turn_timeouts_total', "Games forfeited because a player did not move in time")
+metrics.Gauge('tictactoe_timers', "Timers pending on the timer wheel", lambda: len(TIMERS))
+metrics.Gauge('tictactoe_rooms', "Rooms on this worker", lambda: len(ROOMS))
+metrics.Gauge('tictactoe_connections', "Open client connections on this worker", lambda: len(SESSIONS))
+metrics.Gauge('tictactoe_quickplay_waiting', "Players waiting in the QUICKPLAY queue", lambda: len(QUICKPLAY_QUEUE))
+
+class Session:
+    """Everything the server tracks about one client connection.
+
+    ``sock`` is None once the connection is gone, so a stale reference (a
+    pending hash result, a room broadcast) quietly sends nothing. A logged-in
+    session outlives its connection for RESUME_GRACE seconds, keeping its
+    seat until a new connection presents its token.
+    """
+    __slots__ = ('sock', 'address', 'username', 'room', 'inbound', 'outbound', 'outbound_bytes', 'events',
+                 'awaiting_hash', 'token', 'resume_timer', 'binary', 'bucket', 'throttle_timer', 'pending',
+                 'last_seen', 'heartbeat_timer')
+
+    def __init__(self, sock: Optional[socket.socket] = None, address: str = "") -> None:
+        self.sock = sock
+        self.address = address
+        self.username: Optional[str] = None
+        self.room: Optional[Room] = None
+        self.inbound = MessageBuffer()
+        # Outbound chunks waiting for the socket to become writable, and their total size
+        self.outbound: deque = deque()
+        self.outbound_bytes = 0
+        # The selector events the socket is registered for; 0 while it is not registered
+        self.events = 0
+        # Set while a password hash for this client is running; its later commands wait
+        self.awaiting_hash = False
+        self.token: Optional[str] = None
+        # Runs while the connection is gone but the session may still be resumed
+        self.resume_timer: Optional[Timer] = None
+        # Set after PROTO:BINARY: messages go out in protocol's binary encoding
+        self.binary = False
+        self.bucket: Optional[TokenBucket] = None
+        # Runs while the connection is over its rate limit; its commands wait until then
+        self.throttle_timer: Optional[Timer] = None
+        # Whether the connection is in PENDING_SESSIONS
+        self.pending = False
+        # When the connection last sent anything, and the timer that pings or reaps it when idle
+        self.last_seen = 0.0
+        self.heartbeat_timer: Optional[Timer] = None
+
+class BotPlayer(Session):
+    """Fills a player seat with perfect moves from the solver.
+
+    It has no socket, so messages sent to it are dropped, and it moves as
+    soon as its turn comes up.
+    """
+    __slots__ = ()
+
+    def __init__(self) -> None:
+        super().__init__()
+        self.username = BOT_USERNAME
+
+class Room:
+    """A game and its audience; ``moves`` logs every placed cell in order"""
+    __slots__ = ('name', 'players', 'viewers', 'board', 'moves', 'current_player', 'game_state', 'turn_timer')
+
+    def __init__(self) -> None:
+        self.name = ""
+        self.players: List[Session] = []
+        self.viewers: Dict[Session, None] = {}
+        self.board = create_board()
+        self.moves = eventlog.new_move_log()
+        self.current_player: Optional[Session] = None
+        self.game_state = 'waiting'
+        # Forfeits the game for current_player if they take longer than TURN_TIMEOUT
+        self.turn_timer: Optional[Timer] = None
+
+    def reset(self, name: str, size: int, win_length: Optional[int]) -> None:
+        self.name = name
+        self.players.clear()
+        self.viewers.clear()
+        self.board[:] = create_board(size, win_length)
+        del self.moves[:]
+        self.current_player = None
+        self.game_state = 'waiting'
+
+    def opponent(self, session: Session) -> Session:
+        return self.players[1] if session is self.players[0] else self.players[0]
 
 def main(args: List[str]) -> None:
     if len(args) != 1:
@@ -21,95 +200,894 @@ def main(args: List[str]) -> None:
         sys.exit(1)
 
     config = load_config(args[0])
+    workers = config.get('workers', 1)
+    if not isinstance(workers, int) or workers < 1:
+        print("Error: workers must be a positive integer.")
+        sys.exit(1)
+
+    raise_fd_limit()
+    if workers == 1:
+        serve(config)
+        return
+
+    # Workers append to the shared journal but never compact it, so fold it in once before forking
+    if os.path.exists(config['userDatabase'] + JOURNAL_SUFFIX):
+        load_database(config['userDatabase']).compact()
+    cluster.run_workers(workers, lambda worker_cluster: serve(config, worker_cluster))
+
+def serve(config: Dict[str, Any], worker_cluster: Optional[cluster.Cluster] = None) -> None:
+    global CLUSTER, GAME_ARCHIVE, QUICKPLAY_TIMEOUT, RESUME_GRACE, COMMAND_RATE, COMMAND_BURST, IP_BUCKETS, \
+        SNAPSHOT_INTERVAL, PING_INTERVAL, IDLE_TIMEOUT, TURN_TIMEOUT
+    CLUSTER = worker_cluster
     port = config['port']
-    db_path = config['userDatabase']
-    user_info = load_database(db_path)
+    # Indexed in the background once the loop is running, so startup does not grow with the user count
+    users = open_database(config['userDatabase'])
+    if CLUSTER is not None:
+        users.compact_after = sys.maxsize
+    configure_hashing(config)
+    solver.precompute()
+    if 'gameArchive' in config:
+        # Workers each append to their own file so records never interleave
+        archive_path = config['gameArchive'] if CLUSTER is None else f"{config['gameArchive']}.{CLUSTER.worker_id}"
+        GAME_ARCHIVE = eventlog.GameArchive(archive_path)
+    # Seconds a QUICKPLAY player waits for an opponent before getting a bot; null waits forever
+    QUICKPLAY_TIMEOUT = config.get('quickplayTimeout', QUICKPLAY_TIMEOUT)
+    # Seconds a dropped logged-in connection may RESUME before its game is forfeited; 0 disables
+    RESUME_GRACE = config.get('resumeGrace', RESUME_GRACE)
+    COMMAND_RATE = config.get('commandRate', COMMAND_RATE)
+    COMMAND_BURST = config.get('commandBurst', COMMAND_BURST)
+    ip_rate = config.get('ipCommandRate', IP_COMMAND_RATE)
+    if ip_rate:
+        IP_BUCKETS = BucketTable(ip_rate, config.get('ipCommandBurst', IP_COMMAND_BURST))
+    SNAPSHOT_INTERVAL = config.get('snapshotInterval', SNAPSHOT_INTERVAL)
+    # Each of these is in seconds; null turns it off
+    PING_INTERVAL = config.get('pingInterval', PING_INTERVAL)
+    IDLE_TIMEOUT = config.get('idleTimeout', IDLE_TIMEOUT)
+    TURN_TIMEOUT = config.get('turnTimeout', TURN_TIMEOUT)
+    if 'stateDir' in config:
+        # Workers each keep their own rooms; a restart must use the same worker count to find them
+        restore_state(statestore.StateStore(config['stateDir'], 'rooms' if CLUSTER is None else f'rooms.{CLUSTER.worker_id}'))
+    metrics_socket = open_metrics_listener(config)
 
     with socket.socket(socket.AF_INET, socket.SOCK_STREAM) as server_socket:
         server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+        if CLUSTER is not None:
+            # Every worker binds its own listener and the kernel spreads new connections across them
+            server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
         server_socket.bind(('localhost', port))
-        server_socket.listen()
+        server_socket.listen(socket.SOMAXCONN)
         server_socket.setblocking(False)
 
         try:
-            server_loop(server_socket, user_info, db_path)
+            server_loop(server_socket, users, metrics_socket)
         except KeyboardInterrupt:
             print("Server interrupted.")
+        finally:
+            HASH_POOL.shutdown(wait=False, cancel_futures=True)
+            users.close()
+            if GAME_ARCHIVE is not None:
+                GAME_ARCHIVE.close()
+            if STATE_STORE is not None:
+                STATE_STORE.snapshot(saved_rooms())
+                STATE_STORE.close()
+            if metrics_socket is not None:
+                metrics_socket.close()
+
+def restore_state(store: statestore.StateStore) -> None:
+    global STATE_STORE
+    started = time.perf_counter()
+    saved = store.load()
+    for saved_room in saved:
+        restore_room(saved_room)
+    # Folding the log into a fresh snapshot keeps the next restart as fast as this one
+    store.snapshot(saved_rooms())
+    STATE_STORE = store
+    call_later(SNAPSHOT_INTERVAL, take_snapshot)
+    if saved:
+        print(f"Restored {len(ROOMS)} rooms in {(time.perf_counter() - started) * 1e3:.1f} ms")
+
+def restore_room(saved: statestore.SavedRoom) -> None:
+    # Players come back as detached sessions: their seats wait RESUME_GRACE for a RESUME with
+    # their token, exactly as if their connections had just dropped
+    room = create_room(saved.name, saved.size, saved.win_length)
+    for player in saved.players:
+        if player.bot:
+            session = BotPlayer()
+        else:
+            session = Session()
+            session.username = player.username
+            if player.token is not None:
+                session.token = player.token
+                TOKENS[player.token] = session
+            session.resume_timer = call_later(RESUME_GRACE, lambda session=session: expire_session(session))
+        room.players.append(session)
+        session.room = room
+
+    for turn, cell in enumerate(saved.moves):
+        place(CROSS if turn % 2 == 0 else NOUGHT, room.board, cell % saved.size, cell // saved.size)
+        room.moves.append(cell)
+    if not room.players:
+        end_game(room, None)
+        return
+    if len(room.players) < 2:
+        return
+    mark_room_full(room)
+    if won_or_drawn(room):
+        # The server stopped between the last move and the end of the game; the game is lost
+        end_game(room, None)
+        return
+    room.game_state = 'playing'
+    room.current_player = room.players[len(room.moves) % 2]
+    start_turn_timer(room)
+    if isinstance(room.current_player, BotPlayer):
+        play_bot_turn(room.current_player)
+
+def won_or_drawn(room: Room) -> bool:
+    return players_draw(room.board) or any(
+        player_wins(symbol, room.board) for symbol in (CROSS, NOUGHT)
+    )
+
+def saved_rooms() -> List[statestore.SavedRoom]:
+    saved = []
+    for room in ROOMS.values():
+        saved_room = statestore.SavedRoom(room.name, board_size(room.board), board_win_length(room.board))
+        saved_room.players = [
+            statestore.SavedPlayer(player.username, player.token, isinstance(player, BotPlayer))
+            for player in room.players
+        ]
+        saved_room.moves = room.moves
+        saved.append(saved_room)
+    return saved
+
+def take_snapshot() -> None:
+    STATE_STORE.snapshot(saved_rooms())
+    call_later(SNAPSHOT_INTERVAL, take_snapshot)
+
+def save_seat(room: Room, session: Session) -> None:
+    if STATE_STORE is not None:
+        STATE_STORE.seat_taken(room.name, room.players.index(session), session.username, session.token,
+                               isinstance(session, BotPlayer))
+
+def configure_hashing(config: Dict[str, Any]) -> None:
+    global HASH_POOL, BCRYPT_ROUNDS
+    BCRYPT_ROUNDS = config.get('bcryptRounds', BCRYPT_ROUNDS)
+    if not isinstance(BCRYPT_ROUNDS, int) or not 4 <= BCRYPT_ROUNDS <= 31:
+        print("Error: bcryptRounds must be an integer between 4 and 31.")
+        sys.exit(1)
+    # The worker count caps how many hashes run at once; further requests queue behind them
+    workers = config.get('hashWorkers', os.cpu_count() or 1)
+    if config.get('hashExecutor', 'thread') == 'process':
+        HASH_POOL = ProcessPoolExecutor(max_workers=workers)
+    else:
+        HASH_POOL = ThreadPoolExecutor(max_workers=workers, thread_name_prefix='bcrypt')
+
+def open_metrics_listener(config: Dict[str, Any]) -> Optional[socket.socket]:
+    if 'metricsPort' not in config:
+        return None
+    # Workers each serve their own metrics on consecutive ports
+    port = config['metricsPort'] + (CLUSTER.worker_id if CLUSTER is not None else 0)
+    listener = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    listener.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
+    # Loopback only: the endpoint can start the profiler and has no authentication
+    listener.bind(('127.0.0.1', port))
+    listener.listen()
+    listener.setblocking(False)
+    return listener
+
+def raise_fd_limit() -> None:
+    # Idle logged-in clients each hold a descriptor, so lift the soft limit as far as we may
+    try:
+        import resource
+    except ImportError:
+        return
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or soft < hard:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError):
+            pass
+
+def server_loop(server_socket: socket.socket, users: UserStore, metrics_socket: Optional[socket.socket] = None) -> None:
+    global SELECTOR, WAKEUP_SOCKETS
+    # DefaultSelector is epoll/kqueue where available, so each wakeup only costs the ready sockets
+    SELECTOR = selectors.DefaultSelector()
+    SELECTOR.register(server_socket, selectors.EVENT_READ, lambda: accept_clients(server_socket))
+    WAKEUP_SOCKETS = socket.socketpair()
+    for wakeup_socket in WAKEUP_SOCKETS:
+        wakeup_socket.setblocking(False)
+    SELECTOR.register(WAKEUP_SOCKETS[0], selectors.EVENT_READ, run_callbacks)
+    if CLUSTER is not None:
+        SELECTOR.register(CLUSTER.inbox, selectors.EVENT_READ, lambda: handle_cluster_messages(users))
+    if metrics_socket is not None:
+        SELECTOR.register(metrics_socket, selectors.EVENT_READ, lambda: accept_metrics_requests(metrics_socket))
+
+    if IP_BUCKETS is not None:
+        call_later(IP_BUCKET_PRUNE_INTERVAL, prune_ip_buckets)
+    if not users.loaded:
+        start_loading_users(users)
 
-def server_loop(server_socket: socket.socket, user_info: List[Dict[str, str]], db_path: str) -> None:
-    read_sockets = {server_socket}
-    
     while True:
-        readable, _, exceptional = select.select(read_sockets, [], [])
-        
-        for sock in readable:
-            if sock is server_socket:
-                client_socket, _ = sock.accept()
-                client_socket.setblocking(False)
-                read_sockets.add(client_socket)
-            else:
-                handle_client_socket(sock, read_sockets, user_info, db_path)
-        
-        for sock in exceptional:
-            handle_client_disconnect(sock)
-            read_sockets.remove(sock)
-            sock.close()
-
-def handle_client_socket(sock: socket.socket, read_sockets: set, user_info: List[Dict[str, str]], db_path: str) -> None:
+        ready = SELECTOR.select(0 if PENDING_SESSIONS else next_timer_delay())
+        started = time.perf_counter()
+        for key, events in ready:
+            # Client sockets are registered with their Session, everything else with a callback
+            session = key.data
+            if not isinstance(session, Session):
+                session()
+                continue
+            if events & selectors.EVENT_WRITE and session.sock is not None:
+                flush_outbound(session)
+            if events & selectors.EVENT_READ and session.sock is not None:
+                handle_client_socket(session, users)
+        run_pending_sessions(users)
+        run_timers()
+        if ROOMS_CHANGED:
+            publish_rooms()
+        LOOP_SECONDS.observe(time.perf_counter() - started)
+
+def accept_clients(server_socket: socket.socket) -> None:
+    while True:
+        try:
+            client_socket, address = server_socket.accept()
+        except BlockingIOError:
+            return
+        except ConnectionAbortedError:
+            # The client gave up while queued
+            continue
+        except OSError as error:
+            pause_accepting(server_socket, lambda: accept_clients(server_socket), error)
+            return
+        register_client(client_socket, address[0])
+
+def pause_accepting(listener: socket.socket, on_ready: Callable[[], None], error: OSError) -> None:
+    # The listener stays readable while EMFILE lasts, so retrying at once would spin the loop
+    print(f"Accepting connections failed: {error!r}")
+    SELECTOR.unregister(listener)
+    call_later(ACCEPT_RETRY_DELAY, lambda: SELECTOR.register(listener, selectors.EVENT_READ, on_ready))
+
+def register_client(client_socket: socket.socket, address: str) -> Session:
+    client_socket.setblocking(False)
+    session = Session(client_socket, address)
+    if COMMAND_RATE:
+        session.bucket = TokenBucket(COMMAND_RATE, COMMAND_BURST, time.monotonic())
+    SESSIONS[client_socket] = session
+    update_interest(session)
+    start_heartbeat(session)
+    return session
+
+def update_interest(session: Session) -> None:
+    # Reading stops while the connection has a backlog of commands, is over its
+    # rate limit or is not draining its output, so TCP pushes back on the client
+    sock = session.sock
+    if sock is None:
+        return
+    events = 0
+    if (len(session.inbound) < MAX_COMMANDS_PER_TURN and session.outbound_bytes < OUTBOUND_HIGH_WATER
+            and session.throttle_timer is None):
+        events |= selectors.EVENT_READ
+    if session.outbound:
+        events |= selectors.EVENT_WRITE
+    if events == session.events:
+        return
+    if session.events == 0:
+        SELECTOR.register(sock, events, session)
+    elif events == 0:
+        SELECTOR.unregister(sock)
+    else:
+        SELECTOR.modify(sock, events, session)
+    session.events = events
+
+def run_pending_sessions(users: UserStore) -> None:
+    for _ in range(len(PENDING_SESSIONS)):
+        session = PENDING_SESSIONS.popleft()
+        session.pending = False
+        if session.sock is not None:
+            process_messages(session, users)
+
+def admit_command(session: Session, command: str, users: UserStore) -> bool:
+    buckets = [session.bucket] if session.bucket is not None else []
+    if IP_BUCKETS is not None:
+        buckets.append(IP_BUCKETS.get(session.address, time.monotonic()))
+    if not buckets:
+        return True
+    cost = COMMAND_COSTS.get(command, 1)
+    now = time.monotonic()
+    wait = max(bucket.delay(cost, now) for bucket in buckets)
+    if wait > 0:
+        THROTTLED.inc()
+        session.throttle_timer = call_later(wait, lambda: end_throttle(session, users))
+        return False
+    for bucket in buckets:
+        bucket.take(cost)
+    return True
+
+def end_throttle(session: Session, users: UserStore) -> None:
+    session.throttle_timer = None
+    if session.sock is not None:
+        process_messages(session, users)
+
+def prune_ip_buckets() -> None:
+    IP_BUCKETS.prune(time.monotonic())
+    call_later(IP_BUCKET_PRUNE_INTERVAL, prune_ip_buckets)
+
+def accept_metrics_requests(metrics_socket: socket.socket) -> None:
+    while True:
+        try:
+            conn, _ = metrics_socket.accept()
+        except BlockingIOError:
+            return
+        except ConnectionAbortedError:
+            continue
+        except OSError as error:
+            pause_accepting(metrics_socket, lambda: accept_metrics_requests(metrics_socket), error)
+            return
+        conn.setblocking(False)
+        request = bytearray()
+        SELECTOR.register(conn, selectors.EVENT_READ, lambda conn=conn, request=request: handle_metrics_request(conn, request))
+        call_later(METRICS_TIMEOUT, lambda conn=conn: close_metrics_connection(conn))
+
+def close_metrics_connection(conn: socket.socket) -> None:
+    # Also fires, harmlessly, for connections that finished in time
+    if conn.fileno() == -1:
+        return
+    SELECTOR.unregister(conn)
+    conn.close()
+
+def handle_metrics_request(conn: socket.socket, request: bytearray) -> None:
+    # GET /metrics for Prometheus; GET /profile/start and /profile/stop toggle the sampling profiler
     try:
-        client_msg = sock.recv(8192).decode('ascii')
-        if not client_msg:
-            handle_client_disconnect(sock)
-            read_sockets.remove(sock)
-            sock.close()
-        else:
-            response = handle_client_message(sock, client_msg, user_info, db_path)
-            if response:
-                sock.send(response.encode('ascii'))
-    except ConnectionResetError:
-        handle_client_disconnect(sock)
-        read_sockets.remove(sock)
+        data = conn.recv(4096)
+    except BlockingIOError:
+        return
+    except OSError:
+        data = b''
+    request += data
+    if data and b'\r\n\r\n' not in request and len(request) < 8192:
+        return
+
+    path = bytes(request).split(b' ', 2)[1].decode('ascii', 'replace') if request.count(b' ') >= 2 else ''
+    status = "200 OK"
+    if path == '/metrics':
+        body = metrics.render()
+    elif path == '/profile/start':
+        PROFILER.start()
+        body = "profiler started\n"
+    elif path == '/profile/stop':
+        body = PROFILER.stop()
+    else:
+        status = "404 Not Found"
+        body = "not found\n"
+    payload = body.encode('utf-8')
+    header = f"HTTP/1.0 {status}\r\nContent-Type: text/plain; version=0.0.4\r\nContent-Length: {len(payload)}\r\n\r\n"
+    # Whatever the socket does not take at once is written as it drains, never blocking the loop
+    response = [memoryview(header.encode('ascii') + payload)]
+    SELECTOR.modify(conn, selectors.EVENT_WRITE, lambda: write_metrics_response(conn, response))
+    write_metrics_response(conn, response)
+
+def write_metrics_response(conn: socket.socket, response: List[memoryview]) -> None:
+    try:
+        sent = conn.send(response[0])
+    except BlockingIOError:
+        return
+    except OSError:
+        sent = len(response[0])
+    response[0] = response[0][sent:]
+    if not response[0]:
+        close_metrics_connection(conn)
+
+def call_soon_threadsafe(callback: Callable[[], None]) -> None:
+    CALLBACKS.append(callback)
+    try:
+        WAKEUP_SOCKETS[1].send(b'\0')
+    except BlockingIOError:
+        # The loop already has a wakeup pending
+        pass
+
+def run_callbacks() -> None:
+    try:
+        while WAKEUP_SOCKETS[0].recv(4096):
+            pass
+    except BlockingIOError:
+        pass
+    while CALLBACKS:
+        CALLBACKS.popleft()()
+
+def call_later(delay: float, callback: Callable[[], None]) -> Timer:
+    return TIMERS.call_later(delay, callback, time.monotonic())
+
+def cancel_timer(timer: Optional[Timer]) -> None:
+    if timer is not None:
+        timer.cancel()
+
+def next_timer_delay() -> Optional[float]:
+    return TIMERS.next_delay(time.monotonic())
+
+def run_timers() -> None:
+    now = time.monotonic()
+    for timer in TIMERS.expire(now):
+        # An earlier callback in this batch may have cancelled it
+        callback = timer.callback
+        if callback is not None:
+            TIMER_LAG.observe(now - timer.deadline)
+            callback()
+
+def start_heartbeat(session: Session) -> None:
+    session.last_seen = time.monotonic()
+    arm_heartbeat(session, 0.0)
+
+def arm_heartbeat(session: Session, idle: float) -> None:
+    if PING_INTERVAL:
+        delay = PING_INTERVAL
+    elif IDLE_TIMEOUT is not None:
+        # Without pings the only check due is the idle timeout running out
+        delay = IDLE_TIMEOUT - idle
+    else:
+        return
+    session.heartbeat_timer = call_later(delay, lambda: heartbeat(session))
+
+def heartbeat(session: Session) -> None:
+    # One timer per connection, re-armed every PING_INTERVAL rather than on every read
+    session.heartbeat_timer = None
+    if session.sock is None:
+        return
+    idle = time.monotonic() - session.last_seen
+    if IDLE_TIMEOUT is not None and idle >= IDLE_TIMEOUT:
+        # A half-open or silent connection; it goes the way of any other dropped connection
+        REAPED.inc()
+        close_client(session)
+        return
+    if PING_INTERVAL and idle >= PING_INTERVAL:
+        send_message(session, "PING")
+    arm_heartbeat(session, idle)
+
+def start_turn_timer(room: Room) -> None:
+    cancel_timer(room.turn_timer)
+    room.turn_timer = None
+    if TURN_TIMEOUT is None or isinstance(room.current_player, BotPlayer):
+        return
+    player, seq = room.current_player, len(room.moves)
+    room.turn_timer = call_later(TURN_TIMEOUT, lambda: turn_timed_out(room, player, seq))
+
+def turn_timed_out(room: Room, player: Session, seq: int) -> None:
+    room.turn_timer = None
+    # Rooms are recycled, so make sure this is still the same game and the same turn
+    if room.game_state == 'playing' and room.current_player is player and len(room.moves) == seq:
+        TURN_TIMEOUTS.inc()
+        handle_forfeit(player)
+
+def close_client(session: Session) -> None:
+    if session.token is not None and RESUME_GRACE > 0:
+        # Keep the seat and login for a while in case the client reconnects
+        forget_client(session)
+        session.resume_timer = call_later(RESUME_GRACE, lambda: expire_session(session))
+        return
+    revoke_token(session)
+    handle_client_disconnect(session)
+    forget_client(session)
+
+def expire_session(session: Session) -> None:
+    session.resume_timer = None
+    revoke_token(session)
+    handle_client_disconnect(session)
+
+def issue_token(session: Session) -> None:
+    revoke_token(session)
+    # The worker id prefix lets any worker route a RESUME to the one holding the session
+    worker_id = CLUSTER.worker_id if CLUSTER is not None else 0
+    session.token = f"{worker_id}-{secrets.token_hex(16)}"
+    TOKENS[session.token] = session
+    if session.room is not None and session in session.room.players:
+        save_seat(session.room, session)
+    send_message(session, f"TOKEN:{session.token}")
+
+def revoke_token(session: Session) -> None:
+    if session.token is not None:
+        del TOKENS[session.token]
+        session.token = None
+
+def forget_client(session: Session) -> None:
+    leave_quickplay(session)
+    sock = session.sock
+    if session.events:
+        SELECTOR.unregister(sock)
+    del SESSIONS[sock]
+    sock.close()
+    session.sock = None
+    session.events = 0
+    session.awaiting_hash = False
+    session.outbound.clear()
+    session.outbound_bytes = 0
+    cancel_timer(session.throttle_timer)
+    session.throttle_timer = None
+    cancel_timer(session.heartbeat_timer)
+    session.heartbeat_timer = None
+
+def route_to_shard(session: Session, command: str, args: List[str], msg: str, users: UserStore) -> bool:
+    # Usernames and rooms are sharded across workers: the connection moves to
+    # the worker that owns the key, which then handles this very command
+    if CLUSTER is None or not args:
+        return False
+    owner = CLUSTER.shard_for(args[0].strip())
+    if owner == CLUSTER.worker_id or session.room is not None:
+        return False
+    hand_off(session, owner, msg, users)
+    return True
+
+def hand_off(session: Session, owner: int, msg: str, users: UserStore) -> None:
+    messages, partial = session.inbound.drain()
+    messages.insert(0, msg)
+    if session.outbound:
+        flush_outbound(session)
+    if session.outbound:
+        # Replies still queued here would be lost in the move, so wait until the client has read them
+        retry_hand_off(session, messages, partial, users)
+        return
+    state = {
+        "type": "handoff",
+        "username": session.username,
+        "resumable": session.token is not None,
+        "binary": session.binary,
+        "messages": messages,
+        "partial": partial.decode('latin-1')
+    }
+    try:
+        CLUSTER.send(owner, state, [session.sock.fileno()])
+    except BlockingIOError:
+        # The sibling is behind on its inbox
+        retry_hand_off(session, messages, partial, users)
+        return
+    except OSError as error:
+        # The sibling has exited, or the state does not fit in a datagram
+        print(f"Handoff to worker {owner} failed: {error!r}")
+        close_client(session)
+        return
+    revoke_token(session)
+    forget_client(session)
+
+def retry_hand_off(session: Session, messages: List[str], partial: bytes, users: UserStore) -> None:
+    # The commands go back in the buffer as they were and the connection pauses as if throttled,
+    # so the same command routes again when it resumes
+    session.inbound.feed(''.join(message + '\n' for message in messages).encode('ascii') + partial)
+    session.throttle_timer = call_later(HANDOFF_RETRY_DELAY, lambda: end_throttle(session, users))
+
+def adopt_client(fd: int, state: Dict[str, Any], users: UserStore) -> None:
+    sock = socket.socket(fileno=fd)
+    try:
+        address = sock.getpeername()[0]
+    except OSError:
+        # The client hung up while it was in flight
         sock.close()
+        return
+    session = register_client(sock, address)
+    session.username = state['username']
+    session.binary = state['binary']
+    session.inbound.feed(''.join(message + '\n' for message in state['messages']).encode('ascii'))
+    session.inbound.feed(state['partial'].encode('latin-1'))
+    process_messages(session, users)
+    if state['resumable'] and session.sock is not None:
+        # Tokens name the worker holding the session, so the client gets a new one from this
+        # worker, after the response to the command that brought it here
+        issue_token(session)
 
-def handle_client_disconnect(sock: socket.socket) -> None:
-    if sock in CLIENT_ROOMS:
-        room_name = CLIENT_ROOMS[sock]
-        room = ROOMS[room_name]
-        if sock in room['players']:
-            room['players'].remove(sock)
-            if room['game_state'] == 'playing':
-                handle_forfeit(sock)
-        elif sock in room['viewers']:
-            room['viewers'].remove(sock)
-        del CLIENT_ROOMS[sock]
-    if sock in AUTHENTICATED_CLIENTS:
-        del AUTHENTICATED_CLIENTS[sock]
-    print("Client has disconnected")
+def handle_cluster_messages(users: UserStore) -> None:
+    while (received := CLUSTER.receive()) is not None:
+        payload, fds = received
+        if payload['type'] == 'handoff':
+            adopt_client(fds[0], payload, users)
+        elif payload['type'] == 'rooms':
+            REMOTE_ROOMS[payload['worker']] = payload
+            ROOMLIST_CACHE.clear()
+
+def publish_rooms() -> None:
+    global ROOMS_CHANGED
+    ROOMS_CHANGED = False
+    CLUSTER.broadcast({
+        "type": "rooms",
+        "worker": CLUSTER.worker_id,
+        "PLAYER": list(JOINABLE_ROOMS),
+        "VIEWER": list(ROOMS)
+    })
+
+def invalidate_roomlist() -> None:
+    global ROOMS_CHANGED
+    ROOMLIST_CACHE.clear()
+    ROOMS_CHANGED = CLUSTER is not None
+
+def total_rooms() -> int:
+    return len(ROOMS) + sum(len(rooms['VIEWER']) for rooms in REMOTE_ROOMS.values())
+
+def handle_client_socket(session: Session, users: UserStore) -> None:
+    try:
+        data = session.sock.recv(8192)
+    except BlockingIOError:
+        return
+    except OSError:
+        # Reset, aborted, timed out or unreachable: the connection is gone either way
+        close_client(session)
+        return
+
+    if not data:
+        close_client(session)
+        return
+
+    BYTES_IN.inc(len(data))
+    session.last_seen = time.monotonic()
+    try:
+        session.inbound.feed(data)
+    except ProtocolError:
+        close_client(session)
+        return
+    process_messages(session, users)
 
-def handle_login(users: List[Dict[str, str]], username: str, password: str) -> str:
-    for user in users:
-        if user['username'] == username:
-            if bcrypt.checkpw(password.encode('ascii'), user['password'].encode('ascii')):
-                return "LOGIN:ACKSTATUS:0"
+def process_messages(session: Session, users: UserStore) -> None:
+    # One read may carry many pipelined commands; they wait while a hash for this client is in flight
+    # or the client is over its rate limit, and only MAX_COMMANDS_PER_TURN run before others get a turn
+    buffer = session.inbound
+    handled = 0
+    while (not session.awaiting_hash and session.sock is not None and session.throttle_timer is None
+           and (client_msg := buffer.peek()) is not None):
+        if handled == MAX_COMMANDS_PER_TURN:
+            if not session.pending:
+                session.pending = True
+                PENDING_SESSIONS.append(session)
+            break
+        command = client_msg.split(':', 1)[0].strip()
+        if not admit_command(session, command, users):
+            break
+        buffer.pop()
+        handled += 1
+        COMMANDS.inc(1, command if command in KNOWN_COMMANDS else "INVALID")
+        started = time.perf_counter()
+        response = handle_client_message(session, client_msg, users)
+        COMMAND_SECONDS.observe(time.perf_counter() - started)
+        if response:
+            send_message(session, response)
+    update_interest(session)
+
+def send_message(session: Session, message: str) -> None:
+    send_bytes(session, protocol.encode_text(message) if session.binary else frame(message))
+
+def send_bytes(session: Session, data: bytes) -> None:
+    # Queued chunks are memoryviews over the caller's bytes, so a broadcast
+    # shares one encoded message between every recipient without copying it
+    sock = session.sock
+    if sock is None:
+        return
+    queue = session.outbound
+    if not queue:
+        try:
+            sent = sock.send(data)
+        except BlockingIOError:
+            sent = 0
+        except OSError:
+            # The read side will see the reset and clean up
+            return
+        BYTES_OUT.inc(sent)
+        if sent == len(data):
+            return
+        queue.append(memoryview(data)[sent:])
+        session.outbound_bytes += len(data) - sent
+        update_interest(session)
+    else:
+        queue.append(memoryview(data))
+        session.outbound_bytes += len(data)
+        if session.outbound_bytes >= OUTBOUND_HARD_LIMIT:
+            drop_slow_client(session)
+        elif session.outbound_bytes >= OUTBOUND_HIGH_WATER:
+            update_interest(session)
+
+def drop_slow_client(session: Session) -> None:
+    # Reached mid-broadcast, so the room is left on the next tick rather than while it is iterated;
+    # until then the shut down socket fails every send and nothing more is queued
+    sock = session.sock
+    session.outbound.clear()
+    session.outbound_bytes = 0
+    update_interest(session)
+    try:
+        sock.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
+    print(f"Dropping a client more than {OUTBOUND_HARD_LIMIT} bytes behind")
+    call_later(0, lambda: session.sock is sock and close_client(session))
+
+def flush_outbound(session: Session) -> None:
+    sock = session.sock
+    queue = session.outbound
+    try:
+        if hasattr(sock, 'sendmsg'):
+            sent = sock.sendmsg(list(islice(queue, MAX_IOVECS)))
+        else:
+            sent = sock.send(queue[0])
+    except BlockingIOError:
+        return
+    except OSError:
+        queue.clear()
+        session.outbound_bytes = 0
+        sent = 0
+
+    BYTES_OUT.inc(sent)
+    session.outbound_bytes -= sent
+    while sent:
+        head = queue[0]
+        if sent < len(head):
+            queue[0] = head[sent:]
+            break
+        sent -= len(head)
+        queue.popleft()
+    update_interest(session)
+
+def handle_client_disconnect(session: Session) -> None:
+    room = session.room
+    if room is not None:
+        if session in room.players:
+            if room.game_state == 'playing':
+                handle_forfeit(session)
             else:
-                return "LOGIN:ACKSTATUS:0"
-    return "LOGIN:ACKSTATUS:1"
+                room.players.remove(session)
+                if not room.players:
+                    # Nobody is left to start the game, so drop the room from the lobby
+                    end_game(room, None)
+        else:
+            room.viewers.pop(session, None)
+        session.room = None
+    session.username = None
+    print("Client has disconnected")
+
+def check_password(password: str, hashed_password: str) -> bool:
+    # Imported on first use, in the hash worker, rather than on the startup path
+    import bcrypt
+    return bcrypt.checkpw(password.encode('ascii'), hashed_password.encode('ascii'))
+
+def hash_password(password: str, rounds: int) -> str:
+    import bcrypt
+    return bcrypt.hashpw(password.encode('ascii'), bcrypt.gensalt(rounds)).decode('ascii')
+
+def find_and_check_password(path: str, username: str, password: str) -> Optional[bool]:
+    # For logins before the user file is indexed; None if there is no such user
+    hashed_password = find_user(path, username)
+    if hashed_password is None:
+        return None
+    return check_password(password, hashed_password)
+
+def find_and_hash_password(path: str, username: str, password: str, rounds: int) -> Optional[str]:
+    # For registrations before the user file is indexed; None if the name is taken
+    if find_user(path, username) is not None:
+        return None
+    return hash_password(password, rounds)
+
+def valid_password(password: str) -> bool:
+    # bcrypt also refuses NUL bytes; other control characters have no business in a password either
+    return 0 < len(password) <= MAX_PASSWORD_LENGTH and password.isprintable()
+
+def submit_hash_job(session: Session, func: Callable, args: tuple, on_done: Callable[[Any], Optional[str]],
+                    failure: str, users: UserStore) -> None:
+    # bcrypt takes hundreds of milliseconds, so it runs on HASH_POOL and the
+    # client's remaining commands are held until its result is back on the loop
+    session.awaiting_hash = True
+    submitted = time.perf_counter()
+    future = HASH_POOL.submit(func, *args)
+    future.add_done_callback(
+        lambda future: call_soon_threadsafe(
+            lambda: finish_hash_job(session, future, on_done, failure, users, submitted)
+        )
+    )
+
+def finish_hash_job(session: Session, future: Future, on_done: Callable[[Any], Optional[str]], failure: str,
+                    users: UserStore, submitted: float) -> None:
+    HASH_SECONDS.observe(time.perf_counter() - submitted)
+    if not session.awaiting_hash:
+        # The client disconnected while the hash was running
+        return
+    session.awaiting_hash = False
+    try:
+        result = future.result()
+    except Exception as error:
+        # A malformed stored hash, say: the command fails, not the server
+        print(f"Hash job failed: {error!r}")
+        response = failure
+    else:
+        response = on_done(result)
+    if response:
+        send_message(session, response)
+    process_messages(session, users)
+
+def handle_login(session: Session, users: UserStore, username: str, password: str) -> Optional[str]:
+    hashed_password = users.get(username)
+    if hashed_password is None and users.loaded:
+        return "LOGIN:ACKSTATUS:1"
+    if not valid_password(password):
+        # Nothing it could have been registered with
+        return "LOGIN:ACKSTATUS:2"
+
+    def on_checked(matches: Optional[bool]) -> Optional[str]:
+        if matches is None:
+            return "LOGIN:ACKSTATUS:1"
+        if not matches:
+            return "LOGIN:ACKSTATUS:2"
+        session.username = username
+        send_message(session, "LOGIN:ACKSTATUS:0")
+        issue_token(session)
+
+    if hashed_password is None:
+        # Not indexed yet, so the hash worker looks the user up in the file first
+        submit_hash_job(session, find_and_check_password, (users.path, username, password), on_checked,
+                        "LOGIN:ACKSTATUS:2", users)
+    else:
+        submit_hash_job(session, check_password, (password, hashed_password), on_checked, "LOGIN:ACKSTATUS:2", users)
+
+def handle_proto(session: Session, args: List[str]) -> Optional[str]:
+    # PROTO:BINARY / PROTO:TEXT; the ack still uses the old encoding, everything after it the new one
+    if len(args) != 1 or args[0].strip() not in ("BINARY", "TEXT"):
+        return "PROTO:ACKSTATUS:1"
+    send_message(session, "PROTO:ACKSTATUS:0")
+    session.binary = args[0].strip() == "BINARY"
+
+def handle_resume(session: Session, users: UserStore, token: str) -> Optional[str]:
+    if session.username is not None:
+        return "RESUME:ACKSTATUS:2"
+    detached = TOKENS.get(token)
+    if detached is None:
+        return "RESUME:ACKSTATUS:1"
+    if detached.sock is not None:
+        # The old connection has not noticed it is dead yet; this one replaces it
+        forget_client(detached)
+    cancel_timer(detached.resume_timer)
+    detached.resume_timer = None
 
-def handle_register(user_info: List[Dict[str, str]], db_path: str, username: str, password: str) -> str:
-    if any(user['username'] == username for user in user_info):
+    # Move this connection, and whatever it has pipelined after RESUME, onto the old session
+    sock = session.sock
+    SESSIONS[sock] = detached
+    if session.events:
+        SELECTOR.modify(sock, session.events, detached)
+    detached.sock = sock
+    detached.address = session.address
+    detached.events = session.events
+    detached.inbound = session.inbound
+    detached.outbound = session.outbound
+    detached.outbound_bytes = session.outbound_bytes
+    detached.binary = session.binary
+    session.sock = None
+    cancel_timer(session.heartbeat_timer)
+    session.heartbeat_timer = None
+    start_heartbeat(detached)
+    send_message(detached, "RESUME:ACKSTATUS:0")
+    room = detached.room
+    if room is not None and room.game_state == 'playing':
+        send_snapshot(detached, room)
+    process_messages(detached, users)
+
+def handle_register(session: Session, users: UserStore, username: str, password: str) -> Optional[str]:
+    if len(username) > MAX_USERNAME_LENGTH:
+        return "REGISTER:ACKSTATUS:2"
+    if username in users:
         return "REGISTER:ACKSTATUS:1"
-    
-    hashed_password = bcrypt.hashpw(password.encode('ascii'), bcrypt.gensalt()).decode('ascii')
-    user_info.append({"username": username, "password": hashed_password})
-    save_info_to_db(db_path, user_info)
-    return "REGISTER:ACKSTATUS:0"
+    if not valid_password(password):
+        return "REGISTER:ACKSTATUS:2"
+
+    def on_hashed(hashed_password: Optional[str]) -> str:
+        # Another client may have registered the name while we were hashing
+        if hashed_password is None or username in users:
+            return "REGISTER:ACKSTATUS:1"
+        users.add(username, hashed_password)
+        return "REGISTER:ACKSTATUS:0"
 
-def handle_create(sock: socket.socket, room_name: str) -> str:
+    if users.loaded:
+        submit_hash_job(session, hash_password, (password, BCRYPT_ROUNDS), on_hashed, "REGISTER:ACKSTATUS:1", users)
+    else:
+        submit_hash_job(session, find_and_hash_password, (users.path, username, password, BCRYPT_ROUNDS),
+                        on_hashed, "REGISTER:ACKSTATUS:1", users)
+
+def handle_create(session: Session, room_name: str, size: int = BOARD_SIZE, win_length: Optional[int] = None) -> str:
     room_name = room_name.strip()
     if not room_name:
         return "CREATE:ACKSTATUS:4"
+
+    if win_length is None:
+        win_length = size
+    if not MIN_WIN_LENGTH <= win_length <= size <= MAX_BOARD_SIZE:
+        return "CREATE:ACKSTATUS:4"
     
-    if len(ROOMS) >= MAX_ROOMS:
+    if total_rooms() >= MAX_ROOMS:
         return "CREATE:ACKSTATUS:3"
     
     if len(room_name) > MAX_ROOM_NAME_LENGTH:
@@ -121,172 +1099,367 @@ def handle_create(sock: socket.socket, room_name: str) -> str:
 
     if room_name in ROOMS:
         return "CREATE:ACKSTATUS:2"
+
+    # A seated client is not handed off, but the room still has to live on the worker owning its name
+    if CLUSTER is not None and CLUSTER.shard_for(room_name) != CLUSTER.worker_id:
+        return "CREATE:ACKSTATUS:5"
     
-    create_room(room_name)
-    handle_join(sock, room_name, "PLAYER")
+    create_room(room_name, size, win_length)
+    handle_join(session, room_name, "PLAYER")
     return "CREATE:ACKSTATUS:0"
 
-def create_room(room_name: str):
-    board = create_board()
-    ROOMS[room_name] = {
-        'players': [],
-        'viewers': set(),
-        'board': board,
-        'current_player': None,
-        'game_state': 'waiting'
-    }
+def create_room(room_name: str, size: int = BOARD_SIZE, win_length: Optional[int] = None) -> Room:
+    room = ROOM_POOL.pop() if ROOM_POOL else Room()
+    room.reset(room_name, size, win_length)
+    ROOMS[room_name] = room
+    JOINABLE_ROOMS[room_name] = None
+    invalidate_roomlist()
+    if STATE_STORE is not None:
+        STATE_STORE.room_created(room_name, size, board_win_length(room.board))
+    return room
 
-def handle_join(sock: socket.socket, room_name: str, mode: str):
+def handle_join(session: Session, room_name: str, mode: str):
     room_name = room_name.strip()
     mode = mode.strip()
-    if room_name not in ROOMS:
+    room = ROOMS.get(room_name)
+    if room is None:
         return "JOIN:ACKSTATUS:1"
     
     if mode not in ["PLAYER", "VIEWER"]:
         return "JOIN:ACKSTATUS:3"
     
-    room = ROOMS[room_name]
-    
     if mode == "PLAYER":
-        if len(room['players']) >= 2:
+        if len(room.players) >= 2:
             return "JOIN:ACKSTATUS:2"
-        room['players'].append(sock)
-        CLIENT_ROOMS[sock] = room_name
-        if len(room['players']) == 2:
-            response = "JOIN:ACKSTATUS:0\n"
-            sock.send(response.encode('ascii'))
-            start_game(room_name)
+        room.players.append(session)
+        session.room = room
+        save_seat(room, session)
+        if len(room.players) == 2:
+            mark_room_full(room)
+            send_message(session, "JOIN:ACKSTATUS:0")
+            start_game(room)
             return
     elif mode == "VIEWER":
-        room['viewers'].add(sock)
-        CLIENT_ROOMS[sock] = room_name
-        if room['game_state'] == 'playing':
-            current_player = AUTHENTICATED_CLIENTS[room['current_player']]
-            opposing_player = AUTHENTICATED_CLIENTS[room['players'][0] if room['current_player'] == room['players'][1] else room['players'][1]]
-            response = "JOIN:ACKSTATUS:0\n"
-            sock.send(response.encode('ascii'))
-            inprogress_message = f"INPROGRESS:{current_player}:{opposing_player}"
-            sock.send(inprogress_message.encode('ascii'))
-
-def handle_roomlist(sock: socket.socket, mode: str) -> str:
+        room.viewers[session] = None
+        session.room = room
+        send_message(session, "JOIN:ACKSTATUS:0")
+        if room.game_state == 'playing':
+            # A late viewer catches up from one snapshot, then follows the MOVE stream
+            send_snapshot(session, room)
+
+def handle_resync(session: Session) -> Optional[str]:
+    # A client that sees a gap in MOVE sequence numbers asks for the whole board again
+    room = session.room
+    if room.game_state != 'playing':
+        return "RESYNC:ACKSTATUS:1"
+    send_snapshot(session, room)
+
+def send_snapshot(session: Session, room: Room) -> None:
+    current_player = room.current_player.username
+    opposing_player = room.opponent(room.current_player).username
+    seq = len(room.moves)
+    if session.binary:
+        send_bytes(session, protocol.encode_in_progress(current_player, opposing_player, room.board, seq))
+        return
+    board_status = board_to_string(room.board)
+    inprogress_message = f"INPROGRESS:{current_player}:{opposing_player}:{board_status}:{seq}:{board_win_length(room.board)}"
+    send_message(session, inprogress_message)
+
+def mark_room_full(room: Room) -> None:
+    JOINABLE_ROOMS.pop(room.name, None)
+    invalidate_roomlist()
+
+def handle_roomlist(session: Session, mode: str, offset: int = 0, limit: Optional[int] = None, prefix: str = "") -> Optional[str]:
     mode = mode.strip()
     if mode not in ["PLAYER", "VIEWER"]:
         return f"ROOMLIST:ACKSTATUS:1"
-    available_rooms = [room for room in ROOMS if (mode == "VIEWER" or len(ROOMS[room]['players']) < 2)]
-    room_list = ",".join(available_rooms)
-    return f"ROOMLIST:ACKSTATUS:0:{room_list}"
-
-def start_game(room_name: str) -> None:
-    room = ROOMS[room_name]
-    room['game_state'] = 'playing'
-    room['current_player'] = room['players'][0]
-    player1 = AUTHENTICATED_CLIENTS[room['players'][0]]
-    player2 = AUTHENTICATED_CLIENTS[room['players'][1]]
-    begin_message = f"BEGIN:{player1}:{player2}"
-    broadcast_message(room, begin_message)
-
-def handle_place(sock: socket.socket, x: int, y: int) -> str:
-    room_name = CLIENT_ROOMS.get(sock)
-    if not sock in CLIENT_ROOMS or not room_name in ROOMS:
-        return "NOROOM"
-    
-    room = ROOMS[room_name]
-    board = room['board']
+    rooms = JOINABLE_ROOMS if mode == "PLAYER" else ROOMS
+    if REMOTE_ROOMS:
+        # Lazy, so a cached full list does not walk every worker's rooms
+        rooms = chain(rooms, *(remote[mode] for remote in REMOTE_ROOMS.values()))
+
+    if offset == 0 and limit is None and not prefix:
+        # The full list is what lobbies poll, so it is serialized once per change
+        key = (mode, session.binary)
+        response = ROOMLIST_CACHE.get(key)
+        if response is None:
+            message = f"ROOMLIST:ACKSTATUS:0:{','.join(rooms)}"
+            response = ROOMLIST_CACHE[key] = protocol.encode_text(message) if session.binary else frame(message)
+        send_bytes(session, response)
+        return None
+
+    if limit is None:
+        limit = MAX_ROOMLIST_PAGE
+    matching = (room for room in rooms if room.startswith(prefix)) if prefix else iter(rooms)
+    page = islice(matching, offset, offset + min(limit, MAX_ROOMLIST_PAGE))
+    return f"ROOMLIST:ACKSTATUS:0:{','.join(page)}"
 
-    if room['game_state'] == 'waiting':
+def start_game(room: Room) -> None:
+    room.game_state = 'playing'
+    room.current_player = room.players[0]
+    start_turn_timer(room)
+    player1 = room.players[0].username
+    player2 = room.players[1].username
+    size = board_size(room.board)
+    # The win length goes along, since only the room's creator chose it
+    length = board_win_length(room.board)
+    broadcast_message(room, f"BEGIN:{player1}:{player2}:{size}:{length}",
+                      lambda: protocol.encode_begin(player1, player2, size, length))
+    if isinstance(room.current_player, BotPlayer):
+        play_bot_turn(room.current_player)
+
+def handle_quickplay(session: Session) -> Optional[str]:
+    if session.room is not None or session in QUICKPLAY_QUEUE:
+        return "QUICKPLAY:ACKSTATUS:1"
+    if total_rooms() >= MAX_ROOMS:
+        return "QUICKPLAY:ACKSTATUS:2"
+    send_message(session, "QUICKPLAY:ACKSTATUS:0")
+
+    while QUICKPLAY_QUEUE:
+        opponent, timer = QUICKPLAY_QUEUE.popitem(last=False)
+        cancel_timer(timer)
+        # Queued players who have since joined a room are dropped here rather than searched for
+        if opponent.room is None and opponent.sock is not None:
+            start_quickplay(opponent, session)
+            return
+    timer = None
+    if QUICKPLAY_TIMEOUT is not None:
+        timer = call_later(QUICKPLAY_TIMEOUT, lambda: quickplay_timed_out(session))
+    QUICKPLAY_QUEUE[session] = timer
+
+def leave_quickplay(session: Session) -> None:
+    cancel_timer(QUICKPLAY_QUEUE.pop(session, None))
+
+def quickplay_timed_out(session: Session) -> None:
+    if session not in QUICKPLAY_QUEUE:
+        return
+    del QUICKPLAY_QUEUE[session]
+    if session.room is None and session.sock is not None:
+        start_quickplay(session, None)
+
+def start_quickplay(first: Session, second: Optional[Session]) -> None:
+    # The player who waited longest moves first; nobody answered in time means a bot
+    room = create_room(quickplay_room_name())
+    room.players.append(first)
+    first.room = room
+    save_seat(room, first)
+    if second is None:
+        add_bot(room)
         return
+    room.players.append(second)
+    second.room = room
+    save_seat(room, second)
+    mark_room_full(room)
+    start_game(room)
+
+def quickplay_room_name() -> str:
+    while True:
+        room_name = f"quickplay-{next(QUICKPLAY_ROOMS)}"
+        # The name must shard to this worker so JOIN:<name>:VIEWER finds it
+        if room_name not in ROOMS and (CLUSTER is None or CLUSTER.shard_for(room_name) == CLUSTER.worker_id):
+            return room_name
+
+def handle_addbot(session: Session) -> Optional[str]:
+    room = session.room
+    if room is None or room.game_state != 'waiting' or room.players != [session]:
+        return "ADDBOT:ACKSTATUS:1"
+    send_message(session, "ADDBOT:ACKSTATUS:0")
+    add_bot(room)
+
+def add_bot(room: Room) -> None:
+    bot = BotPlayer()
+    room.players.append(bot)
+    bot.room = room
+    save_seat(room, bot)
+    mark_room_full(room)
+    start_game(room)
+
+def play_bot_turn(bot: BotPlayer) -> None:
+    room = bot.room
+    player_symbol = CROSS if bot is room.players[0] else NOUGHT
+    # Every reachable position was solved at startup, so this is a table lookup
+    x, y = solver.best_move(player_symbol, room.board)
+    handle_place(bot, x, y)
+
+def handle_place(session: Session, x: int, y: int) -> Optional[str]:
+    # A refused move is answered with its own status, since nothing else will answer it
+    room = session.room
+    if room is None:
+        return "NOROOM"
+    board = room.board
+
+    if room.game_state != 'playing':
+        return "PLACE:ACKSTATUS:1"
+    if session is not room.current_player:
+        # Viewers and players out of turn; the move log (and everything replayed from it) assumes X and O alternate
+        return "PLACE:ACKSTATUS:2"
     
-    player_symbol = CROSS if sock == room['players'][0] else NOUGHT
-    board[y][x] = player_symbol
-    board_status = board_to_string(board)
+    player_symbol = CROSS if session is room.players[0] else NOUGHT
+    try:
+        won = place(player_symbol, board, x, y)
+    except ValueError:
+        # Off the board or already taken
+        return "PLACE:ACKSTATUS:3"
+    room.moves.append(y * board_size(board) + x)
+    if STATE_STORE is not None:
+        STATE_STORE.moved(room.name, y * board_size(board) + x)
     
-    if player_wins(player_symbol, board):
-        end_game(room_name, AUTHENTICATED_CLIENTS[sock])
-        message = f"GAMEEND:{board_status}:0:{AUTHENTICATED_CLIENTS[sock]}"
-        broadcast_message(room, message)
+    if won:
+        broadcast_game_end(room, eventlog.RESULT_WIN, session.username)
+        end_game(room, session.username, eventlog.RESULT_WIN)
     elif players_draw(board):
-        end_game(room_name, None)
-        message = f"GAMEEND:{board_status}:1"
-        broadcast_message(room, message)
+        broadcast_game_end(room, eventlog.RESULT_DRAW, None)
+        end_game(room, None, eventlog.RESULT_DRAW)
     else:
-        room['current_player'] = room['players'][1] if sock == room['players'][0] else room['players'][0]
-        board_message = f"BOARDSTATUS:{board_status}"
-        broadcast_message(room, board_message)
+        room.current_player = room.opponent(session)
+        start_turn_timer(room)
+        # Clients apply the delta to their own board, so a move costs the same on any board size
+        seq = len(room.moves)
+        broadcast_message(
+            room,
+            f"MOVE:{seq}:{x}:{y}:{player_symbol}",
+            lambda: protocol.encode_move(seq, x, y, player_symbol)
+        )
+        if isinstance(room.current_player, BotPlayer):
+            play_bot_turn(room.current_player)
 
-def handle_forfeit(sock: socket.socket) -> str:
-    room_name = CLIENT_ROOMS.get(sock)
-    if not sock in CLIENT_ROOMS or not room_name in ROOMS:
+def handle_forfeit(session: Session) -> Optional[str]:
+    # Refused like PLACE: a waiting room has no opponent, and a viewer has no game to give up
+    room = session.room
+    if room is None:
         return "NOROOM"
-    
-    room = ROOMS[room_name]
+    if room.game_state != 'playing':
+        return "FORFEIT:ACKSTATUS:1"
+    if session not in room.players:
+        return "FORFEIT:ACKSTATUS:2"
 
-    winner = AUTHENTICATED_CLIENTS[room['players'][1] if sock == room['players'][0] else room['players'][0]]
-    board_status = board_to_string(room['board'])
-    forfeit_message = f"GAMEEND:{board_status}:2:{winner}"
-    broadcast_message(room, forfeit_message)
-    
-    room['game_state'] = 'ended'
+    winner = room.opponent(session).username
+    broadcast_game_end(room, eventlog.RESULT_FORFEIT, winner)
+    end_game(room, winner, eventlog.RESULT_FORFEIT)
 
-def end_game(room_name: str, winner: str) -> None:
-    room = ROOMS[room_name]
-    room['game_state'] = 'ended'
-    board_status = board_to_string(room['board'])
-    
-    for client in room['players'] + list(room['viewers']):
-        if client in CLIENT_ROOMS:
-            del CLIENT_ROOMS[client]
-    
-    del ROOMS[room_name]
+def broadcast_game_end(room: Room, result: int, winner: Optional[str]) -> None:
+    board = room.board
 
-def board_to_string(board: List[List[int]]) -> str:
-    return ''.join(['0' if cell == EMPTY else '1' if cell == CROSS else '2' for row in board for cell in row])
+    def text() -> str:
+        board_status = board_to_string(board)
+        return f"GAMEEND:{board_status}:{result}:{winner}" if winner is not None else f"GAMEEND:{board_status}:{result}"
 
-def handle_client_message(sock: socket.socket, msg: str, user_info: List[Dict[str, str]], db_path: str) -> str:
+    broadcast_message(room, text, lambda: protocol.encode_game_end(board, result, winner))
+
+def end_game(room: Room, winner: Optional[str], result: Optional[int] = None) -> None:
+    room.game_state = 'ended'
+    cancel_timer(room.turn_timer)
+    room.turn_timer = None
+    if GAME_ARCHIVE is not None and result is not None:
+        board = room.board
+        players = [player.username for player in room.players]
+        GAME_ARCHIVE.append(board_size(board), board_win_length(board), players, result, winner, room.moves)
+    for client in chain(room.players, room.viewers):
+        client.room = None
+
+    if STATE_STORE is not None:
+        STATE_STORE.room_closed(room.name)
+    del ROOMS[room.name]
+    JOINABLE_ROOMS.pop(room.name, None)
+    invalidate_roomlist()
+    # Finished rooms are recycled rather than left for the garbage collector
+    room.reset("", BOARD_SIZE, None)
+    if len(ROOM_POOL) < MAX_POOLED_ROOMS:
+        ROOM_POOL.append(room)
+
+def board_to_string(board: List[int]) -> str:
+    return bitboard_to_string(board)
+
+def handle_client_message(session: Session, msg: str, users: UserStore) -> str:
     command, *args = msg.split(':')
     command = command.strip()
+
+    if command in ("LOGIN", "REGISTER", "CREATE", "JOIN") and route_to_shard(session, command, args, msg, users):
+        return None
     
+    if command == "PING":
+        return "PONG"
+    if command == "PONG":
+        # Only here to refresh last_seen, which any input does
+        return None
+    if command == "PROTO":
+        return handle_proto(session, args)
+    if command == "RESUME":
+        if len(args) != 1:
+            return "RESUME:ACKSTATUS:1"
+        token = args[0].strip()
+        worker = token.split('-', 1)[0]
+        if CLUSTER is not None and session.username is None and worker.isdigit() \
+                and int(worker) != CLUSTER.worker_id and int(worker) < CLUSTER.n_workers:
+            hand_off(session, int(worker), msg, users)
+            return None
+        return handle_resume(session, users, token)
     if command == "LOGIN":
         if len(args) != 2:
             return "LOGIN:ACKSTATUS:3"
-        response = handle_login(user_info, *args)
-        if response == "LOGIN:ACKSTATUS:0":
-            AUTHENTICATED_CLIENTS[sock] = args[0]
-        return response
+        return handle_login(session, users, *args)
     if command == "REGISTER":
         if len(args) != 2:
             return "REGISTER:ACKSTATUS:2"
-        return handle_register(user_info, db_path, *args)
+        return handle_register(session, users, *args)
     
-    elif sock not in AUTHENTICATED_CLIENTS:
+    elif session.username is None:
         return "BADAUTH"
     
     if command == "CREATE":
-        if len(args) != 1:
+        # CREATE:<name> is a classic 3x3 room; CREATE:<name>:<size>:<win length> sets up a variant
+        if len(args) not in (1, 3):
             return "CREATE:ACKSTATUS:4"
         name = args[0]
-        return handle_create(sock, name)
+        if len(args) == 1:
+            return handle_create(session, name)
+        try:
+            size, win_length = int(args[1]), int(args[2])
+        except ValueError:
+            return "CREATE:ACKSTATUS:4"
+        return handle_create(session, name, size, win_length)
     if command == "JOIN":
         if len(args) != 2:
             return "JOIN:ACKSTATUS:3"
         room_name = args[0]
         mode = args[1]
-        return handle_join(sock, room_name, mode)
+        return handle_join(session, room_name, mode)
     if command == "ROOMLIST":
-        if len(args) != 1:
+        # ROOMLIST:<mode> lists every room; ROOMLIST:<mode>:<offset>:<limit>[:<prefix>] returns one page
+        if len(args) not in (1, 3, 4):
             return f"ROOMLIST:ACKSTATUS:1"
         mode = args[0]
-        return handle_roomlist(sock, mode)
+        if len(args) == 1:
+            return handle_roomlist(session, mode)
+        try:
+            offset, limit = int(args[1]), int(args[2])
+        except ValueError:
+            return f"ROOMLIST:ACKSTATUS:1"
+        if offset < 0 or limit < 0:
+            return f"ROOMLIST:ACKSTATUS:1"
+        prefix = args[3].strip() if len(args) == 4 else ""
+        return handle_roomlist(session, mode, offset, limit, prefix)
+    if command == "ADDBOT":
+        return handle_addbot(session)
+    if command == "QUICKPLAY":
+        if CLUSTER is not None and CLUSTER.worker_id != MATCHMAKING_WORKER and session.room is None:
+            hand_off(session, MATCHMAKING_WORKER, msg, users)
+            return None
+        return handle_quickplay(session)
     
-    elif command in ["PLACE", "FORFEIT"]:
-        if sock not in CLIENT_ROOMS:
+    elif command in ["PLACE", "FORFEIT", "RESYNC"]:
+        if session.room is None:
             return "NOROOM"
+        if command == "RESYNC":
+            return handle_resync(session)
         if command == "PLACE":
-            if len(args) != 2:
+            try:
+                x, y = map(int, args)
+            except ValueError:
                 return "PLACE:ACKSTATUS:4"
-            x, y = args
-            return handle_place(sock, int(x), int(y))
+            return handle_place(session, x, y)
         elif command == "FORFEIT":
-            return handle_forfeit(sock)
+            return handle_forfeit(session)
     else:
         return "INVALID COMMAND INPUT"
 
@@ -312,37 +1485,60 @@ def load_config(path: str) -> Dict[str, Any]:
 
     return config
 
-def load_database(path: str) -> List[Dict[str, str]]:
+def open_database(path: str) -> UserStore:
+    # Only checks the file is there; start_loading_users reads it
     if not os.path.exists(path):
         print(f"Error: {path} doesn't exist.")
         sys.exit(1)
+    return UserStore(path)
+
+def load_database(path: str) -> UserStore:
+    open_database(path)
     try:
         with open(path, 'r') as f:
-            user_info = json.load(f)
-    except json.JSONDecodeError:
-        print(f"Error: {path} is not in a valid JSON format.")
-        sys.exit(1)
-
-    if not isinstance(user_info, list):
-        print(f"Error: {path} is not a JSON array.")
+            users = UserStore(path, dict(iter_users(f)))
+    except ValueError as error:
+        print(database_error(path, error))
         sys.exit(1)
+    users.replay_journal()
+    return users
 
-    for user in user_info:
-        if set(user.keys()) != {"username", "password"}:
-            print(f"Error: {path} contains invalid user record formats.")
-            sys.exit(1)
+def database_error(path: str, error: Exception) -> str:
+    if isinstance(error, json.JSONDecodeError):
+        return f"Error: {path} is not in a valid JSON format."
+    if isinstance(error, ValueError):
+        return f"Error: {path} {error}."
+    return f"Error: {path} cannot be read: {error}"
 
-    return user_info
+def start_loading_users(users: UserStore) -> None:
+    started = time.perf_counter()
+    users.load(lambda error: call_soon_threadsafe(lambda: users_loaded(users, error, started)))
 
-def save_info_to_db(db_path: str, user_info: List[Dict[str, str]]) -> None:
-    with open(db_path, 'w') as f:
-        json.dump(user_info, f)
+def users_loaded(users: UserStore, error: Optional[Exception], started: float) -> None:
+    if error is not None:
+        print(database_error(users.path, error))
+        sys.exit(1)
+    print(f"Indexed {len(users)} users in {(time.perf_counter() - started) * 1e3:.1f} ms")
 
-def broadcast_message(room: Dict[str, Any], message: str) -> None:
-    for player in room['players']:
-        player.send(message.encode('ascii'))
-    for viewer in room['viewers']:
-        viewer.send(message.encode('ascii'))
+def broadcast_message(room: Room, message: Union[str, Callable[[], str]],
+                      binary: Optional[Callable[[], bytes]] = None) -> None:
+    # Each encoding is built at most once, and only if somebody in the room uses it
+    text_data = binary_data = None
+    BROADCAST_FANOUT.observe(len(room.players) + len(room.viewers))
+    for session in chain(room.players, room.viewers):
+        if session.sock is None:
+            continue
+        if session.binary:
+            if binary_data is None:
+                if binary is not None:
+                    binary_data = binary()
+                else:
+                    binary_data = protocol.encode_text(message if isinstance(message, str) else message())
+            send_bytes(session, binary_data)
+        else:
+            if text_data is None:
+                text_data = frame(message if isinstance(message, str) else message())
+            send_bytes(session, text_data)
 
 if __name__ == "__main__":
     main(sys.argv[1:])
\ No newline at end of file
@@ -0,0 +1,254 @@
+import sys
+import random
+import argparse
+from concurrent.futures import ProcessPoolExecutor
+from typing import Callable, Dict, List, NamedTuple, Optional, Sequence
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+from game import BOARD_SIZE, CROSS, NOUGHT
+from bitboard import Bitboard, create_board, board_size, place, players_draw
+import solver
+
+
+__all__ = [
+    "STRATEGIES",
+    "SimulationResult",
+    "random_strategy",
+    "solver_strategy",
+    "heuristic_strategy",
+    "scripted_strategy",
+    "play_game",
+    "simulate",
+    "simulate_batch",
+    "run_parallel"
+]
+
+
+# A strategy picks the (column, row) to play for player on a bitboard
+Strategy = Callable[[str, Bitboard, random.Random], tuple[int, int]]
+
+# Games per chunk handed to a pool worker
+CHUNK_SIZE = 50000
+
+
+class SimulationResult(NamedTuple):
+    games: int = 0
+    cross_wins: int = 0
+    nought_wins: int = 0
+    draws: int = 0
+
+    def __add__(self, other: 'SimulationResult') -> 'SimulationResult':
+        return SimulationResult(*(mine + theirs for mine, theirs in zip(self, other)))
+
+#############################################################
+############### Private functions—do not use! ###############
+#############################################################
+
+def _empty_cells(board: Bitboard) -> List[int]:
+    size = board_size(board)
+    occupied = board[0] | board[1]
+    return [cell for cell in range(size * size) if not occupied >> cell & 1]
+
+
+def _win_lines(size: int, win_length: int) -> List[List[int]]:
+    lines = []
+    for y in range(size):
+        for x in range(size):
+            for dx, dy in ((1, 0), (0, 1), (1, 1), (1, -1)):
+                end_x = x + dx * (win_length - 1)
+                end_y = y + dy * (win_length - 1)
+                if 0 <= end_x < size and 0 <= end_y < size:
+                    lines.append([(y + dy * i) * size + x + dx * i for i in range(win_length)])
+    return lines
+
+
+def _solver_table():
+    """Best cell for every classic position, indexed by its base-3 encoding (1 cross, 2 nought)"""
+    powers = 3 ** np.arange(BOARD_SIZE * BOARD_SIZE)
+    table = np.full(3 ** (BOARD_SIZE * BOARD_SIZE), -1, dtype=np.int16)
+    for crosses, noughts, cell in solver.solved_moves():
+        key = sum(int(powers[i]) * (1 if crosses >> i & 1 else 2 if noughts >> i & 1 else 0)
+                  for i in range(BOARD_SIZE * BOARD_SIZE))
+        table[key] = cell
+    return table, powers
+
+
+def _simulate_chunk(n_games: int, cross: str, nought: str, size: int, win_length: Optional[int],
+                    seed: int, batch: bool) -> SimulationResult:
+    if batch:
+        return simulate_batch(n_games, cross, nought, size, win_length, seed)
+    return simulate(n_games, STRATEGIES[cross], STRATEGIES[nought], size, win_length, seed)
+
+##########################################################
+############### Public functions—use these ###############
+##########################################################
+
+def random_strategy(player: str, board: Bitboard, rng: random.Random) -> tuple[int, int]:
+    """Plays a uniformly random empty cell"""
+    size = board_size(board)
+    cell = rng.choice(_empty_cells(board))
+    return (cell % size, cell // size)
+
+
+def solver_strategy(player: str, board: Bitboard, rng: random.Random) -> tuple[int, int]:
+    """Perfect play on the classic board, the solver's heuristic elsewhere"""
+    return solver.best_move(player, board)
+
+
+def heuristic_strategy(player: str, board: Bitboard, rng: random.Random) -> tuple[int, int]:
+    """Win if possible, else block, else play nearest the center"""
+    return solver.heuristic_move(player, board)
+
+
+def scripted_strategy(moves: Sequence[tuple[int, int]], fallback: Strategy = random_strategy) -> Strategy:
+    """Plays the first still-empty move of a fixed script, then falls back to another strategy"""
+    def strategy(player: str, board: Bitboard, rng: random.Random) -> tuple[int, int]:
+        size = board_size(board)
+        occupied = board[0] | board[1]
+        for x, y in moves:
+            if not occupied >> (y * size + x) & 1:
+                return (x, y)
+        return fallback(player, board, rng)
+    return strategy
+
+
+STRATEGIES: Dict[str, Strategy] = {
+    "random": random_strategy,
+    "solver": solver_strategy,
+    "heuristic": heuristic_strategy,
+}
+
+
+def play_game(cross: Strategy, nought: Strategy, size: int = BOARD_SIZE, win_length: Optional[int] = None,
+              rng: Optional[random.Random] = None, moves: Optional[List[tuple[int, int]]] = None) -> Optional[str]:
+    """Plays one game without any I/O and returns the winner, or None for a draw.
+
+    Cross moves first. Pass a list as ``moves`` to record the game's moves.
+    """
+    if rng is None:
+        rng = random.Random()
+    board = create_board(size, win_length)
+    strategies = {CROSS: cross, NOUGHT: nought}
+    player = CROSS
+    while True:
+        x, y = strategies[player](player, board, rng)
+        if moves is not None:
+            moves.append((x, y))
+        if place(player, board, x, y):
+            return player
+        if players_draw(board):
+            return None
+        player = NOUGHT if player == CROSS else CROSS
+
+
+def simulate(n_games: int, cross: Strategy, nought: Strategy, size: int = BOARD_SIZE,
+             win_length: Optional[int] = None, seed: Optional[int] = None) -> SimulationResult:
+    """Plays n_games one after another and returns the totals"""
+    rng = random.Random(seed)
+    wins = {CROSS: 0, NOUGHT: 0, None: 0}
+    for _ in range(n_games):
+        wins[play_game(cross, nought, size, win_length, rng)] += 1
+    return SimulationResult(n_games, wins[CROSS], wins[NOUGHT], wins[None])
+
+
+def simulate_batch(n_games: int, cross: str, nought: str, size: int = BOARD_SIZE,
+                   win_length: Optional[int] = None, seed: Optional[int] = None) -> SimulationResult:
+    """Plays n_games in lockstep as rows of a NumPy array.
+
+    Every turn places one marker on each unfinished board and checks all win
+    lines with one matrix product. Supports the "random" strategy on any
+    board and "solver" on the classic board. Requires NumPy.
+    """
+    if np is None:
+        raise ImportError("simulate_batch requires numpy")
+    if win_length is None:
+        win_length = size
+    classic = size == BOARD_SIZE and win_length == BOARD_SIZE
+    for name in (cross, nought):
+        if name not in ("random", "solver") or (name == "solver" and not classic):
+            raise ValueError(f"batch mode does not support the {name!r} strategy on this board")
+
+    rng = np.random.default_rng(seed)
+    n_cells = size * size
+    lines = np.zeros((len(_win_lines(size, win_length)), n_cells), dtype=np.int16)
+    for index, line in enumerate(_win_lines(size, win_length)):
+        lines[index, line] = 1
+    if "solver" in (cross, nought):
+        table, powers = _solver_table()
+
+    boards = np.zeros((n_games, n_cells), dtype=np.int8)
+    winners = np.zeros(n_games, dtype=np.int8)
+    active = np.arange(n_games)
+    for turn in range(n_cells):
+        if active.size == 0:
+            break
+        code = 1 if turn % 2 == 0 else 2
+        boards_left = boards[active]
+        if (cross if code == 1 else nought) == "solver":
+            cells = table[boards_left.astype(np.int64) @ powers]
+        else:
+            scores = rng.random(boards_left.shape)
+            scores[boards_left != 0] = -1.0
+            cells = scores.argmax(axis=1)
+        boards[active, cells] = code
+
+        mine = (boards[active] == code).astype(np.int16)
+        won = (mine @ lines.T == win_length).any(axis=1)
+        winners[active[won]] = code
+        active = active[~won]
+
+    cross_wins = int((winners == 1).sum())
+    nought_wins = int((winners == 2).sum())
+    return SimulationResult(n_games, cross_wins, nought_wins, n_games - cross_wins - nought_wins)
+
+
+def run_parallel(n_games: int, cross: str, nought: str, size: int = BOARD_SIZE, win_length: Optional[int] = None,
+                 workers: Optional[int] = None, seed: Optional[int] = None, batch: bool = False) -> SimulationResult:
+    """Splits n_games into chunks across a process pool; strategies are named from STRATEGIES"""
+    chunks = [CHUNK_SIZE] * (n_games // CHUNK_SIZE)
+    if n_games % CHUNK_SIZE:
+        chunks.append(n_games % CHUNK_SIZE)
+    seeds = random.Random(seed).sample(range(1 << 30), len(chunks))
+    total = SimulationResult()
+    with ProcessPoolExecutor(max_workers=workers) as pool:
+        futures = [
+            pool.submit(_simulate_chunk, chunk, cross, nought, size, win_length, chunk_seed, batch)
+            for chunk, chunk_seed in zip(chunks, seeds)
+        ]
+        for future in futures:
+            total += future.result()
+    return total
+
+
+def main(args: List[str]) -> None:
+    parser = argparse.ArgumentParser(description="Headless self-play between tic-tac-toe strategies")
+    parser.add_argument('--games', type=int, default=100000)
+    parser.add_argument('--cross', choices=sorted(STRATEGIES), default='random')
+    parser.add_argument('--nought', choices=sorted(STRATEGIES), default='random')
+    parser.add_argument('--size', type=int, default=BOARD_SIZE)
+    parser.add_argument('--win-length', type=int)
+    parser.add_argument('--workers', type=int, help="process pool size (default: one per CPU)")
+    parser.add_argument('--seed', type=int)
+    parser.add_argument('--batch', action='store_true', help="advance boards in lockstep with NumPy")
+    parsed = parser.parse_args(args)
+
+    if parsed.batch and np is None:
+        print("Error: --batch requires numpy.")
+        sys.exit(1)
+    if parsed.cross == 'solver' or parsed.nought == 'solver':
+        # Solve once here so forked workers inherit the table instead of each solving it
+        solver.precompute()
+
+    result = run_parallel(parsed.games, parsed.cross, parsed.nought, parsed.size, parsed.win_length,
+                          parsed.workers, parsed.seed, parsed.batch)
+    print(f"games:       {result.games}")
+    for label, count in (("cross wins", result.cross_wins), ("nought wins", result.nought_wins), ("draws", result.draws)):
+        print(f"{label + ':':<13}{count} ({count / max(result.games, 1):.1%})")
+
+
+if __name__ == "__main__":
+    main(sys.argv[1:])
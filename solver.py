@@ -0,0 +1,233 @@
+from typing import Iterator, Optional
+
+from game import BOARD_SIZE, CROSS, NOUGHT
+from bitboard import Bitboard, N_CELLS, FULL_MASK, WIN_MASKS, board_size, win_length, place
+
+
+__all__ = [
+    "precompute",
+    "best_move",
+    "solved_moves",
+    "heuristic_move",
+    "position_value"
+]
+
+
+# Transposition-table entry flags for the value stored alongside them
+EXACT = 0
+LOWER_BOUND = 1
+UPPER_BOUND = 2
+
+INFINITY = N_CELLS + 2
+
+# Center first, then corners, then edges: strong moves first means more alpha-beta cutoffs
+MOVE_ORDER = tuple(sorted(
+    range(N_CELLS),
+    key=lambda cell: (
+        (cell % BOARD_SIZE, cell // BOARD_SIZE) != (BOARD_SIZE // 2, BOARD_SIZE // 2),
+        cell % BOARD_SIZE not in (0, BOARD_SIZE - 1) or cell // BOARD_SIZE not in (0, BOARD_SIZE - 1)
+    )
+))
+
+#############################################################
+############### Private functions—do not use! ###############
+#############################################################
+
+def _symmetries() -> list[list[int]]:
+    """The 8 rotations and reflections of the board as cell permutations"""
+    def cell(x, y):
+        return y * BOARD_SIZE + x
+
+    last = BOARD_SIZE - 1
+    transforms = (
+        lambda x, y: (x, y),
+        lambda x, y: (last - y, x),
+        lambda x, y: (last - x, last - y),
+        lambda x, y: (y, last - x),
+        lambda x, y: (last - x, y),
+        lambda x, y: (x, last - y),
+        lambda x, y: (y, x),
+        lambda x, y: (last - y, last - x),
+    )
+    return [
+        [cell(*transform(x, y)) for y in range(BOARD_SIZE) for x in range(BOARD_SIZE)]
+        for transform in transforms
+    ]
+
+
+def _symmetry_tables() -> tuple[tuple[int, ...], ...]:
+    """For each symmetry, the transformed value of every possible player mask"""
+    tables = []
+    for permutation in _symmetries():
+        table = []
+        for mask in range(FULL_MASK + 1):
+            transformed = 0
+            for cell in range(N_CELLS):
+                if mask >> cell & 1:
+                    transformed |= 1 << permutation[cell]
+            table.append(transformed)
+        tables.append(tuple(table))
+    return tuple(tables)
+
+
+_SYMMETRY_TABLES = _symmetry_tables()
+# Canonical position -> (value, flag), shared by all 8 symmetric variants of a position
+_TRANSPOSITIONS: dict[int, tuple[int, int]] = {}
+# (crosses, noughts) -> best cell for the side to move, for every reachable position
+_BEST_MOVES: dict[tuple[int, int], int] = {}
+
+
+def _canonical(mover: int, other: int) -> int:
+    return min(table[mover] | table[other] << N_CELLS for table in _SYMMETRY_TABLES)
+
+
+def _wins(mask: int) -> bool:
+    for line in WIN_MASKS:
+        if mask & line == line:
+            return True
+    return False
+
+
+def _negamax(mover: int, other: int, alpha: int, beta: int) -> int:
+    """Value of the position for the side to move; quicker wins score higher"""
+    occupied = mover | other
+    if _wins(other):
+        return -(1 + N_CELLS - occupied.bit_count())
+    if occupied == FULL_MASK:
+        return 0
+
+    key = _canonical(mover, other)
+    entry = _TRANSPOSITIONS.get(key)
+    if entry is not None:
+        value, flag = entry
+        if flag == EXACT:
+            return value
+        if flag == LOWER_BOUND:
+            alpha = max(alpha, value)
+        else:
+            beta = min(beta, value)
+        if alpha >= beta:
+            return value
+
+    original_alpha = alpha
+    best = -INFINITY
+    for cell in MOVE_ORDER:
+        bit = 1 << cell
+        if occupied & bit:
+            continue
+        value = -_negamax(other, mover | bit, -beta, -alpha)
+        if value > best:
+            best = value
+            alpha = max(alpha, value)
+            if alpha >= beta:
+                break
+
+    if best <= original_alpha:
+        flag = UPPER_BOUND
+    elif best >= beta:
+        flag = LOWER_BOUND
+    else:
+        flag = EXACT
+    _TRANSPOSITIONS[key] = (best, flag)
+    return best
+
+
+def _solve_position(mover: int, other: int) -> int:
+    best_cell = -1
+    best = -INFINITY
+    occupied = mover | other
+    for cell in MOVE_ORDER:
+        bit = 1 << cell
+        if occupied & bit:
+            continue
+        value = -_negamax(other, mover | bit, -INFINITY, INFINITY)
+        if value > best:
+            best_cell, best = cell, value
+    return best_cell
+
+
+def _crosses_to_move(crosses: int, noughts: int) -> bool:
+    return crosses.bit_count() == noughts.bit_count()
+
+##########################################################
+############### Public functions—use these ###############
+##########################################################
+
+def precompute() -> None:
+    """Solves every reachable position so later lookups are O(1)"""
+    if _BEST_MOVES:
+        return
+    stack = [(0, 0)]
+    seen = {(0, 0)}
+    while stack:
+        crosses, noughts = stack.pop()
+        if _wins(crosses) or _wins(noughts) or crosses | noughts == FULL_MASK:
+            continue
+        crosses_to_move = _crosses_to_move(crosses, noughts)
+        if crosses_to_move:
+            _BEST_MOVES[(crosses, noughts)] = _solve_position(crosses, noughts)
+        else:
+            _BEST_MOVES[(crosses, noughts)] = _solve_position(noughts, crosses)
+
+        for cell in range(N_CELLS):
+            bit = 1 << cell
+            if (crosses | noughts) & bit:
+                continue
+            child = (crosses | bit, noughts) if crosses_to_move else (crosses, noughts | bit)
+            if child not in seen:
+                seen.add(child)
+                stack.append(child)
+
+
+def best_move(player: str, board: Bitboard) -> Optional[tuple[int, int]]:
+    """Returns the (column, row) indices of a perfect move, or None if the game is over.
+
+    Only the classic 3x3 board is solved; larger boards get heuristic_move.
+    """
+    if board_size(board) != BOARD_SIZE or win_length(board) != BOARD_SIZE:
+        return heuristic_move(player, board)
+    crosses, noughts = board[0], board[1]
+    cell = _BEST_MOVES.get((crosses, noughts))
+    if cell is None:
+        if not _BEST_MOVES:
+            precompute()
+            return best_move(player, board)
+        return None
+    return (cell % BOARD_SIZE, cell // BOARD_SIZE)
+
+
+def solved_moves() -> Iterator[tuple[int, int, int]]:
+    """Yields (crosses, noughts, best cell) for every reachable undecided classic position"""
+    precompute()
+    for (crosses, noughts), cell in _BEST_MOVES.items():
+        yield crosses, noughts, cell
+
+
+def heuristic_move(player: str, board: Bitboard) -> Optional[tuple[int, int]]:
+    """Returns a winning move, else a blocking move, else the empty cell nearest the center"""
+    size = board_size(board)
+    occupied = board[0] | board[1]
+    empty = [cell for cell in range(size * size) if not occupied >> cell & 1]
+    if not empty:
+        return None
+
+    opponent = NOUGHT if player == CROSS else CROSS
+    for candidate in (player, opponent):
+        for cell in empty:
+            if place(candidate, board[:], cell % size, cell // size):
+                return (cell % size, cell // size)
+
+    center = (size - 1) / 2
+    cell = min(empty, key=lambda cell: abs(cell % size - center) + abs(cell // size - center))
+    return (cell % size, cell // size)
+
+
+def position_value(player: str, board: Bitboard) -> int:
+    """Perfect-play value of the classic board for the player: positive wins, 0 draws, negative loses"""
+    crosses, noughts = board[0], board[1]
+    mover, other = (crosses, noughts) if player == CROSS else (noughts, crosses)
+    if _wins(mover):
+        return 1 + N_CELLS - (crosses | noughts).bit_count()
+    if _crosses_to_move(crosses, noughts) == (player == CROSS):
+        return _negamax(mover, other, -INFINITY, INFINITY)
+    return -_negamax(other, mover, -INFINITY, INFINITY)
@@ -0,0 +1,222 @@
+import os
+import struct
+import zlib
+from array import array
+from typing import BinaryIO, Dict, Iterable, Iterator, List, NamedTuple, Optional, Tuple
+
+from eventlog import moves_from_bytes, moves_to_bytes, read_exactly
+
+
+__all__ = [
+    "SavedPlayer",
+    "SavedRoom",
+    "StateStore"
+]
+
+
+SNAPSHOT_MAGIC = b'TTTS\x01'
+LOG_MAGIC = b'TTTW\x01'
+# Both files start with their magic and a generation number; a log only
+# applies on top of the snapshot of the same generation
+FILE_HEADER = struct.Struct('<Q')
+# Record type and payload length, then the payload, then a CRC-32 of both
+RECORD_HEADER = struct.Struct('<BH')
+RECORD_CRC = struct.Struct('<I')
+
+# name, size byte, win length byte
+ROOM_CREATED = 1
+# name, seat byte, flags byte (FLAG_BOT), username, token ('' for none); replaces whoever had the seat
+SEAT_TAKEN = 2
+# name, then cells (little-endian unsigned 16-bit) appended to the move log
+MOVES = 3
+# name
+ROOM_CLOSED = 4
+
+FLAG_BOT = 1
+
+
+class SavedPlayer(NamedTuple):
+    username: str
+    token: Optional[str]
+    bot: bool
+
+
+class SavedRoom:
+    """A room as the store last recorded it; the board is rebuilt by replaying ``moves``"""
+
+    __slots__ = ('name', 'size', 'win_length', 'players', 'moves')
+
+    def __init__(self, name: str, size: int, win_length: int) -> None:
+        self.name = name
+        self.size = size
+        self.win_length = win_length
+        self.players: List[SavedPlayer] = []
+        self.moves = array('H')
+
+#############################################################
+############### Private functions—do not use! ###############
+#############################################################
+
+def _string(value: str) -> bytes:
+    encoded = value.encode('ascii')
+    return struct.pack('<H', len(encoded)) + encoded
+
+
+def _read_string(payload: bytes, offset: int) -> Tuple[str, int]:
+    (length,) = struct.unpack_from('<H', payload, offset)
+    offset += 2
+    return payload[offset:offset + length].decode('ascii'), offset + length
+
+
+def _record(kind: int, payload: bytes) -> bytes:
+    header = RECORD_HEADER.pack(kind, len(payload))
+    return header + payload + RECORD_CRC.pack(zlib.crc32(header + payload))
+
+
+def _read_records(f: BinaryIO) -> Iterator[Tuple[int, bytes]]:
+    while (header := read_exactly(f, RECORD_HEADER.size)) is not None:
+        kind, length = RECORD_HEADER.unpack(header)
+        payload = read_exactly(f, length)
+        crc = read_exactly(f, RECORD_CRC.size)
+        if payload is None or crc is None or RECORD_CRC.unpack(crc)[0] != zlib.crc32(header + payload):
+            # Short or failing its CRC: the last write, cut off by a crash
+            return
+        yield kind, payload
+
+
+def _read_file(path: str, magic: bytes) -> Tuple[Optional[int], List[Tuple[int, bytes]]]:
+    """The file's generation and records; generation None if it is missing or not ours"""
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return None, []
+    with f:
+        if f.read(len(magic)) != magic:
+            return None, []
+        header = f.read(FILE_HEADER.size)
+        if len(header) != FILE_HEADER.size:
+            return None, []
+        return FILE_HEADER.unpack(header)[0], list(_read_records(f))
+
+
+def _apply(rooms: Dict[str, SavedRoom], kind: int, payload: bytes) -> None:
+    name, offset = _read_string(payload, 0)
+    if kind == ROOM_CREATED:
+        rooms[name] = SavedRoom(name, payload[offset], payload[offset + 1])
+        return
+    room = rooms.get(name)
+    if room is None:
+        return
+    if kind == SEAT_TAKEN:
+        seat, flags = payload[offset], payload[offset + 1]
+        username, offset = _read_string(payload, offset + 2)
+        token, _ = _read_string(payload, offset)
+        player = SavedPlayer(username, token or None, bool(flags & FLAG_BOT))
+        if seat < len(room.players):
+            room.players[seat] = player
+        else:
+            room.players.append(player)
+    elif kind == MOVES:
+        room.moves.extend(moves_from_bytes(payload[offset:]))
+    elif kind == ROOM_CLOSED:
+        del rooms[name]
+
+
+def _open_private(path: str, flags: int) -> int:
+    # The files hold resume tokens, which are as good as a login while they last
+    return os.open(path, flags | os.O_WRONLY | os.O_CREAT, 0o600)
+
+##########################################################
+############### Public functions—use these ###############
+##########################################################
+
+class StateStore:
+    """Crash-safe copy of the room table: a snapshot plus a write-ahead log.
+
+    Every change is appended to the log as a checksummed record and written
+    out before the server goes on, so a crashed process loses nothing. The
+    log only grows until ``snapshot`` writes the whole table to a new
+    snapshot file, renames it over the old one and starts an empty log of
+    the next generation. ``load`` reads the snapshot and replays the log
+    that belongs to it, stopping at the first torn record.
+    """
+
+    __slots__ = ('snapshot_path', 'log_path', 'generation', '_log')
+
+    def __init__(self, directory: str, name: str = 'rooms') -> None:
+        os.makedirs(directory, exist_ok=True)
+        self.snapshot_path = os.path.join(directory, f'{name}.snapshot')
+        self.log_path = os.path.join(directory, f'{name}.log')
+        self.generation = 0
+        self._log: Optional[BinaryIO] = None
+
+    def load(self) -> List[SavedRoom]:
+        """The rooms as of the last record written, in creation order"""
+        rooms: Dict[str, SavedRoom] = {}
+        generation, records = _read_file(self.snapshot_path, SNAPSHOT_MAGIC)
+        self.generation = generation or 0
+        for kind, payload in records:
+            _apply(rooms, kind, payload)
+        log_generation, records = _read_file(self.log_path, LOG_MAGIC)
+        # A crash after the rename but before the new log leaves an older log, already in the snapshot
+        if log_generation == self.generation:
+            for kind, payload in records:
+                _apply(rooms, kind, payload)
+        return list(rooms.values())
+
+    def snapshot(self, rooms: Iterable[SavedRoom]) -> None:
+        """Replaces the snapshot with rooms and starts a new, empty log"""
+        generation = self.generation + 1
+        data = bytearray(SNAPSHOT_MAGIC + FILE_HEADER.pack(generation))
+        for room in rooms:
+            data += self._room_records(room)
+        temporary_path = self.snapshot_path + '.tmp'
+        fd = _open_private(temporary_path, os.O_TRUNC)
+        try:
+            os.write(fd, data)
+            os.fsync(fd)
+        finally:
+            os.close(fd)
+        os.replace(temporary_path, self.snapshot_path)
+
+        if self._log is not None:
+            self._log.close()
+        self._log = os.fdopen(_open_private(self.log_path, os.O_TRUNC), 'wb')
+        self._log.write(LOG_MAGIC + FILE_HEADER.pack(generation))
+        self._log.flush()
+        self.generation = generation
+
+    def room_created(self, name: str, size: int, win_length: int) -> None:
+        self._append(ROOM_CREATED, _string(name) + bytes((size, win_length)))
+
+    def seat_taken(self, name: str, seat: int, username: str, token: Optional[str], bot: bool = False) -> None:
+        payload = _string(name) + bytes((seat, FLAG_BOT if bot else 0)) + _string(username) + _string(token or '')
+        self._append(SEAT_TAKEN, payload)
+
+    def moved(self, name: str, cell: int) -> None:
+        self._append(MOVES, _string(name) + struct.pack('<H', cell))
+
+    def room_closed(self, name: str) -> None:
+        self._append(ROOM_CLOSED, _string(name))
+
+    def close(self) -> None:
+        if self._log is not None:
+            self._log.close()
+            self._log = None
+
+    def _append(self, kind: int, payload: bytes) -> None:
+        if self._log is None:
+            raise ValueError("snapshot() must be called before changes are logged")
+        # Flushed per record: a process crash loses nothing, though a power cut may lose the tail
+        self._log.write(_record(kind, payload))
+        self._log.flush()
+
+    def _room_records(self, room: SavedRoom) -> bytes:
+        data = _record(ROOM_CREATED, _string(room.name) + bytes((room.size, room.win_length)))
+        for seat, player in enumerate(room.players):
+            payload = (_string(room.name) + bytes((seat, FLAG_BOT if player.bot else 0))
+                       + _string(player.username) + _string(player.token or ''))
+            data += _record(SEAT_TAKEN, payload)
+        if room.moves:
+            data += _record(MOVES, _string(room.name) + moves_to_bytes(room.moves))
+        return data
@@ -0,0 +1,95 @@
+import math
+from typing import Callable, List, Optional
+
+
+__all__ = [
+    "Timer",
+    "TimerWheel"
+]
+
+
+class Timer:
+    """A scheduled callback; ``callback`` is None once it has been cancelled"""
+
+    __slots__ = ('deadline', 'tick', 'callback')
+
+    def __init__(self, deadline: float, tick: int, callback: Callable[[], None]) -> None:
+        self.deadline = deadline
+        self.tick = tick
+        self.callback: Optional[Callable[[], None]] = callback
+
+    def cancel(self) -> None:
+        self.callback = None
+
+
+class TimerWheel:
+    """Hashed timing wheel: timers hash into slots by the tick they are due on.
+
+    Scheduling and cancelling are O(1) whatever the number of timers, and
+    each tick only looks at one slot. Timers further out than a full turn
+    of the wheel share a slot with nearer ones and wait for a later turn.
+    Deadlines are rounded up to the next tick, so ``tick`` bounds how late
+    a timer fires.
+    """
+
+    __slots__ = ('tick', '_slots', '_current', '_count')
+
+    def __init__(self, tick: float = 0.05, slots: int = 1024) -> None:
+        self.tick = tick
+        self._slots: List[List[Timer]] = [[] for _ in range(slots)]
+        # The last tick whose slot has been run
+        self._current: Optional[int] = None
+        # Timers scheduled and not yet expired, including cancelled ones not yet swept
+        self._count = 0
+
+    def __len__(self) -> int:
+        return self._count
+
+    def call_later(self, delay: float, callback: Callable[[], None], now: float) -> Timer:
+        if self._count == 0:
+            # Nothing is pending, so there is no backlog of ticks to catch up on
+            self._current = math.floor(now / self.tick)
+        deadline = now + delay
+        tick = max(math.ceil(deadline / self.tick), self._current + 1)
+        timer = Timer(deadline, tick, callback)
+        self._slots[tick % len(self._slots)].append(timer)
+        self._count += 1
+        return timer
+
+    def next_delay(self, now: float) -> Optional[float]:
+        """Seconds until the next tick that may have work, or None if no timers are pending"""
+        if self._count == 0:
+            return None
+        # Skipping empty slots lets an idle loop sleep through them; one turn is scanned at most
+        slots = self._slots
+        tick = self._current + 1
+        while not slots[tick % len(slots)] and tick <= self._current + len(slots):
+            tick += 1
+        return max(0.0, tick * self.tick - now)
+
+    def expire(self, now: float) -> List[Timer]:
+        """Removes and returns the timers due by now, cancelled ones excluded, in deadline-tick order"""
+        if self._count == 0:
+            return []
+        target = math.floor(now / self.tick)
+        # After a long stall every slot is visited once rather than once per missed tick
+        first = max(self._current + 1, target - len(self._slots) + 1)
+        expired: List[Timer] = []
+        for tick in range(first, target + 1):
+            slot = self._slots[tick % len(self._slots)]
+            if not slot:
+                continue
+            waiting = []
+            for timer in slot:
+                if timer.tick <= target:
+                    self._count -= 1
+                    if timer.callback is not None:
+                        expired.append(timer)
+                elif timer.callback is not None:
+                    waiting.append(timer)
+                else:
+                    self._count -= 1
+            slot[:] = waiting
+        self._current = max(self._current, target)
+        expired.sort(key=lambda timer: timer.tick)
+        return expired
@@ -0,0 +1,369 @@
+import os
+import json
+import threading
+from typing import Callable, Dict, Iterator, Optional, TextIO, Tuple
+
+
+__all__ = [
+    "JOURNAL_SUFFIX",
+    "UserStore",
+    "iter_users",
+    "iter_journal",
+    "find_user"
+]
+
+
+JOURNAL_SUFFIX = '.journal'
+# The user file is read this many characters at a time
+CHUNK_SIZE = 1 << 16
+# Records longer than this are taken for a damaged file
+MAX_RECORD_LENGTH = 4096
+
+_WHITESPACE = ' \t\r\n'
+
+
+def _skip_space(text: str, offset: int) -> int:
+    while offset < len(text) and text[offset] in _WHITESPACE:
+        offset += 1
+    return offset
+
+
+def _decode_records(decoder: json.JSONDecoder, text: str) -> Tuple[list, int]:
+    """The complete comma-separated values at the start of text, and the offset just past the last"""
+    # Usually everything up to the last '}' is whole records, and one C call decodes them all
+    end = text.rfind('}') + 1
+    if end:
+        try:
+            return json.loads('[' + text[:end] + ']'), end
+        except json.JSONDecodeError:
+            pass
+    # That '}' was inside a string, or the file is damaged: go one record at a time
+    records: list = []
+    end = offset = 0
+    while True:
+        try:
+            record, offset = decoder.raw_decode(text, _skip_space(text, offset))
+        except json.JSONDecodeError:
+            return records, end
+        records.append(record)
+        end = offset
+        offset = _skip_space(text, offset)
+        if not text.startswith(',', offset):
+            return records, end
+        offset += 1
+
+
+def iter_users(f: TextIO) -> Iterator[Tuple[str, str]]:
+    """Streams (username, password hash) pairs from a JSON array of user records.
+
+    Only about one chunk of the file is held at a time. Syntax errors raise
+    json.JSONDecodeError, and other ValueErrors say what is wrong with an
+    otherwise valid file.
+    """
+    text = f.read(CHUNK_SIZE)
+    while text and _skip_space(text, 0) == len(text):
+        text = f.read(CHUNK_SIZE)
+    text = text.lstrip(_WHITESPACE)
+    if not text.startswith('['):
+        # Tell a malformed file from valid JSON that is not an array
+        json.loads(text + f.read())
+        raise ValueError("is not a JSON array")
+    text = text[1:]
+    while not text.strip(_WHITESPACE) and (chunk := f.read(CHUNK_SIZE)):
+        text += chunk
+    if text.lstrip(_WHITESPACE).startswith(']'):
+        return
+
+    decoder = json.JSONDecoder()
+    # From here text always starts at a record, after '[' or a ','
+    while True:
+        chunk = f.read(CHUNK_SIZE)
+        text += chunk
+        records, end = _decode_records(decoder, text)
+        if not records:
+            if chunk and len(text) <= MAX_RECORD_LENGTH:
+                continue
+            # Nothing decodes however much is read; raise the decoder's own error
+            decoder.raw_decode(text, _skip_space(text, 0))
+        for record in records:
+            if not isinstance(record, dict) or record.keys() != {"username", "password"}:
+                raise ValueError("contains invalid user record formats")
+            yield record['username'], record['password']
+
+        text = text[end:]
+        while not text.strip(_WHITESPACE) and (chunk := f.read(CHUNK_SIZE)):
+            text += chunk
+        offset = _skip_space(text, 0)
+        if text.startswith(']', offset):
+            return
+        if not text.startswith(',', offset):
+            raise json.JSONDecodeError("Expecting ',' delimiter", text, offset)
+        text = text[offset + 1:]
+
+
+def iter_journal(path: str, end: Optional[int] = None) -> Iterator[Tuple[str, str]]:
+    """Yields the (username, password hash) pairs journalled in the first ``end`` bytes of path"""
+    try:
+        f = open(path, 'rb')
+    except FileNotFoundError:
+        return
+    with f:
+        for line in f:
+            if end is not None:
+                end -= len(line)
+                if end < 0:
+                    break
+            try:
+                record = json.loads(line)
+            except ValueError:
+                # A torn final line from a crash mid-append
+                break
+            yield record['username'], record['password']
+
+
+def _search_users(f: TextIO, username: str) -> Tuple[Optional[str], bool]:
+    """Searches the raw text for the quoted username and decodes only the record around it.
+
+    Returns the password hash, and whether any match could not be decoded
+    (a '{' inside a string, or an overlong record), in which case a miss
+    is not conclusive.
+    """
+    needle = json.dumps(username)
+    decoder = json.JSONDecoder()
+    text = ''
+    # A name with characters JSON may or may not escape can be written more than one way
+    unsure = needle[1:-1] != username
+    while chunk := f.read(CHUNK_SIZE):
+        # Chunks overlap by a record's length, so every record is whole in at least one of them
+        text = text[-MAX_RECORD_LENGTH:] + chunk
+        index = text.find(needle)
+        while index >= 0:
+            start = text.rfind('{', 0, index)
+            try:
+                record = decoder.raw_decode(text, start)[0] if start >= 0 else None
+            except json.JSONDecodeError:
+                record = None
+            if isinstance(record, dict) and record.get('username') == username:
+                return record.get('password'), False
+            unsure = unsure or not isinstance(record, dict)
+            index = text.find(needle, index + 1)
+    return None, unsure
+
+
+def find_user(path: str, username: str) -> Optional[str]:
+    """Looks one user's password hash up in the user file and its journal.
+
+    For the lookups that arrive before ``UserStore.load`` has finished
+    indexing; it reads the whole file but parses little of it.
+    """
+    try:
+        with open(path, 'r') as f:
+            password, unsure = _search_users(f, username)
+        if password is None and unsure:
+            with open(path, 'r') as f:
+                password = next((hashed for name, hashed in iter_users(f) if name == username), None)
+        if password is not None:
+            return password
+    except (OSError, ValueError):
+        # load() reports a damaged file; a lookup just finds nothing
+        pass
+    for name, password in iter_journal(path + JOURNAL_SUFFIX):
+        if name == username:
+            return password
+    return None
+
+
+class UserStore:
+    """Username-indexed user records backed by a JSON file plus an append-only journal.
+
+    The JSON array at ``path`` stays the canonical format. New registrations
+    are appended to ``path + '.journal'`` as one JSON object per line and
+    fsynced in batches of ``sync_every``; once ``compact_after`` records, or
+    a quarter of the user count if that is more, have been journalled they
+    are folded back into the JSON array. The array is rewritten atomically
+    on a background thread and the journal trimmed by a later ``add``, so
+    registration cost does not grow with the number of users.
+
+    A store created without ``users`` starts empty and is filled by ``load``
+    on a background thread, so a server can take connections first. Until
+    ``loaded`` is set, ``get`` only knows about users added since, and any
+    other user has to be looked up with ``find_user``.
+    """
+
+    __slots__ = ('path', 'journal_path', 'sync_every', 'compact_after', 'loaded',
+                 '_users', '_journal', '_journalled', '_unsynced', '_lock',
+                 '_compactor', '_compacted')
+
+    def __init__(self, path: str, users: Optional[Dict[str, str]] = None,
+                 sync_every: int = 64, compact_after: int = 4096) -> None:
+        self.path = path
+        self.journal_path = path + JOURNAL_SUFFIX
+        self.sync_every = sync_every
+        self.compact_after = compact_after
+        self.loaded = users is not None
+        self._users = {} if users is None else users
+        self._journal = None
+        self._journalled = 0
+        self._unsynced = 0
+        # Guards _users and _journalled against the loading thread
+        self._lock = threading.Lock()
+        # The background compaction, and once it is written, the (journal offset, records) it covered
+        self._compactor: Optional[threading.Thread] = None
+        self._compacted: Optional[Tuple[int, int]] = None
+
+    def __len__(self) -> int:
+        return len(self._users)
+
+    def __contains__(self, username: str) -> bool:
+        return username in self._users
+
+    def __iter__(self) -> Iterator[str]:
+        return iter(self._users)
+
+    def get(self, username: str) -> Optional[str]:
+        """Returns the user's password hash, or None if there is no such user"""
+        return self._users.get(username)
+
+    def replay_journal(self) -> None:
+        """Applies records journalled since the last compaction"""
+        for username, password in iter_journal(self.journal_path):
+            self._users[username] = password
+            self._journalled += 1
+
+    def load(self, on_done: Callable[[Optional[Exception]], None]) -> None:
+        """Indexes the file and journal on a background thread.
+
+        on_done is called from that thread, with None once the users are
+        indexed or with the error that stopped it.
+        """
+        # Anything journalled from here on is also added to _users by add()
+        try:
+            journal_end = os.path.getsize(self.journal_path)
+        except FileNotFoundError:
+            journal_end = 0
+        threading.Thread(target=self._load, args=(journal_end, on_done), name='userstore-load', daemon=True).start()
+
+    def add(self, username: str, hashed_password: str) -> None:
+        """Adds a user, journalling the record"""
+        with self._lock:
+            self._users[username] = hashed_password
+            self._journalled += 1
+        if self._journal is None:
+            self._journal = open(self.journal_path, 'ab')
+        record = json.dumps({"username": username, "password": hashed_password})
+        self._journal.write(record.encode('ascii') + b'\n')
+        self._journal.flush()
+        self._unsynced += 1
+        if self._compacted is not None:
+            self._trim_journal()
+        # Compacting before the load finishes would drop the users not yet indexed
+        if (self._journalled >= max(self.compact_after, len(self._users) // 4)
+                and self.loaded and self._compactor is None):
+            self._start_compaction()
+        elif self._unsynced >= self.sync_every:
+            self.sync()
+
+    def sync(self) -> None:
+        """Forces journalled records to disk"""
+        if self._journal is not None and self._unsynced:
+            os.fsync(self._journal.fileno())
+        self._unsynced = 0
+
+    def compact(self) -> None:
+        """Rewrites the JSON file with every user and empties the journal, blocking until done"""
+        self._finish_compaction()
+        self._write_users(dict(self._users))
+
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        if os.path.exists(self.journal_path):
+            os.remove(self.journal_path)
+        self._journalled = 0
+        self._unsynced = 0
+
+    def close(self) -> None:
+        """Syncs and closes the journal"""
+        self._finish_compaction()
+        self.sync()
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+
+    def _write_users(self, users: Dict[str, str]) -> None:
+        records = [{"username": username, "password": password} for username, password in users.items()]
+        tmp_path = self.path + '.tmp'
+        with open(tmp_path, 'w') as f:
+            json.dump(records, f)
+            f.flush()
+            os.fsync(f.fileno())
+        os.replace(tmp_path, self.path)
+
+    def _start_compaction(self) -> None:
+        # Everything journalled so far is in the snapshot; later records stay in the journal
+        self.sync()
+        end = self._journal.tell() if self._journal is not None else 0
+        users = dict(self._users)
+        self._compactor = threading.Thread(target=self._compact, args=(users, end, self._journalled),
+                                           name='userstore-compact', daemon=True)
+        self._compactor.start()
+
+    def _compact(self, users: Dict[str, str], end: int, journalled: int) -> None:
+        try:
+            self._write_users(users)
+        except OSError as error:
+            # The journal still holds every record, so a later add tries again
+            print(f"User file compaction failed: {error!r}")
+            self._compacted = (0, 0)
+            return
+        self._compacted = (end, journalled)
+
+    def _trim_journal(self) -> None:
+        """Drops the journal records the finished compaction wrote to the JSON file"""
+        end, journalled = self._compacted
+        self._compactor.join()
+        self._compactor = None
+        self._compacted = None
+        if not end:
+            return
+        # Only what was added while the file was written is left, so this stays small
+        self.sync()
+        with open(self.journal_path, 'rb') as f:
+            f.seek(end)
+            tail = f.read()
+        tmp_path = self.journal_path + '.tmp'
+        with open(tmp_path, 'wb') as f:
+            f.write(tail)
+            f.flush()
+            os.fsync(f.fileno())
+        if self._journal is not None:
+            self._journal.close()
+            self._journal = None
+        # A crash before this only leaves records that are in both files, which replay harmlessly
+        os.replace(tmp_path, self.journal_path)
+        with self._lock:
+            self._journalled -= journalled
+
+    def _finish_compaction(self) -> None:
+        if self._compactor is not None:
+            self._compactor.join()
+            self._trim_journal()
+
+    def _load(self, journal_end: int, on_done: Callable[[Optional[Exception]], None]) -> None:
+        try:
+            with open(self.path, 'r') as f:
+                users = dict(iter_users(f))
+        except (OSError, ValueError) as error:
+            on_done(error)
+            return
+        journalled = 0
+        for username, password in iter_journal(self.journal_path, journal_end):
+            users[username] = password
+            journalled += 1
+        with self._lock:
+            # Users added while loading are newer than anything read from disk
+            users.update(self._users)
+            self._users = users
+            self._journalled += journalled
+            self.loaded = True
+        on_done(None)